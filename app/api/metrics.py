@@ -0,0 +1,42 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.utils.functions import principal_cache
+from app.utils.metrics import Counter, Gauge, registry
+from app.utils.passwords import password_hasher
+
+router = APIRouter()
+
+# Values owned by other components, read only when scraped
+registry.register(
+    Counter(
+        "principal_cache_events_total",
+        "Authenticated principal cache hits and misses",
+        ("result",),
+        callback=lambda: [
+            (("hit",), principal_cache.hits),
+            (("miss",), principal_cache.misses),
+        ],
+    )
+)
+registry.register(
+    Gauge(
+        "principal_cache_size",
+        "Entries held by the authenticated principal cache",
+        callback=lambda: [((), len(principal_cache))],
+    )
+)
+registry.register(
+    Gauge(
+        "password_hash_pending",
+        "bcrypt jobs running or queued on the hashing pool",
+        callback=lambda: [((), password_hasher._pending)],
+    )
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """
+    This endpoint exposes the application metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
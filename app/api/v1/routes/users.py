@@ -1,67 +1,290 @@
 import os
-from fastapi.responses import HTMLResponse
-from typing import List, cast
+import tempfile
+from fastapi.responses import HTMLResponse, StreamingResponse
+from typing import List, Optional, Tuple
 from app.settings import settings
 from app.models.models import User
-from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.mails.mail_config import send_email
+from app.db.repositories import UserRepository, get_user_repository, public_record
+from app.db.repositories import EmailTaken, get_read_user_repository
+from app.mails.outbox import enqueue_email, enqueue_email_for_user, outbox_worker
 from fastapi.security import OAuth2PasswordRequestForm
 from app.schema.user_schema import UserCreate, UserFromDB
 from app.schema.user_schema import AccessToken, UserUpdate, Message
-from fastapi import APIRouter, Depends, HTTPException, Header, Request, status
+from app.schema.user_schema import BatchOperationResult, BatchOperationType
+from app.schema.user_schema import BatchUser, RefreshTokenRequest, UserBatch
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi import status
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from app.utils.functions import get_current_user, get_user_by_email_or_404
 from app.utils.functions import get_user_or_404, create_jwt_token, get_all_users
+from app.utils.functions import pagination, principal_cache, token_claims
+from app.utils.functions import batch_ids
+from app.utils.passwords import password_hasher
+from app.utils.refresh_tokens import issue_refresh_token, rotate_refresh_token
+from app.utils.revocations import DELETED, revoke_user_tokens, revoke_users_tokens
+from app.utils.templates import PrerenderedPage, load_templates_dir
+from app.utils.user_import import import_users, iter_report
+from app.utils.user_export import iter_csv, iter_ndjson
+from app.utils.responses import FastJSONResponse
+from app.utils.admission import account_gate, limit_login_attempts, login_gate
+from app.utils.conditional import check_not_modified, is_conditional
+from app.utils.conditional import user_validators
 
 
 # Creating users router
 router = APIRouter()
 # Serializer instance
 serializer = URLSafeTimedSerializer(settings.SECRET_KEY)
+# Confirmation pages, compiled once at import
+page_templates = load_templates_dir(
+    os.path.join(os.path.abspath(os.path.dirname(__file__)), "templates")
+)
+# Failure pages do not depend on the user, so they are served prerendered
+confirmation_expired_page = PrerenderedPage(
+    page_templates["ConfirmationEmailFailed.html"](msg="Confirmation link has expired")
+)
+confirmation_invalid_page = PrerenderedPage(
+    page_templates["ConfirmationEmailFailed.html"](msg="Invalid token provided")
+)
 
 
 @router.get(
     "/users/me",
     response_model=UserFromDB,
+    response_class=FastJSONResponse,
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(get_current_user)],
 )
-async def get_self_info(user: User = Depends(get_current_user)):
+async def get_self_info(request: Request, user: User = Depends(get_current_user)):
     """
     This endpoint allow to confirm an account by accessing to a link send to the email provided.
     If link is valid the user will be allowed to access, in the other hand, access will be forbidden
     """
-    return cast(UserFromDB, user.__dict__)
+    validators = user_validators(
+        user.id,
+        user.row_version,
+        user.updated_at or user.creation_date,
+        user.creation_date,
+    )
+    check_not_modified(request, validators)
+    headers = validators.headers() if validators is not None else None
+    return FastJSONResponse(public_record(user.__dict__), headers=headers)
 
 
 @router.get(
     "/users",
     response_model=List[UserFromDB],
+    response_class=FastJSONResponse,
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(get_current_user)],
 )
-async def get_users(users: List[UserFromDB] = Depends(get_all_users)):
+async def get_users(
+    response: Response, users: List[UserFromDB] = Depends(get_all_users)
+):
     """
     This endpoint allow to confirm an account by accessing to a link send to the email provided.
     If link is valid the user will be allowed to access, in the other hand, access will be forbidden
     """
-    return users
+    return FastJSONResponse(users, headers=dict(response.headers))
+
+
+@router.get(
+    "/users/export",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    dependencies=[Depends(get_current_user)],
+)
+async def export_accounts(
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    repository: UserRepository = Depends(get_read_user_repository),
+):
+    """
+    This endpoint allow to download every user as NDJSON or CSV. Rows are streamed
+    from a database cursor as they are read, so memory use does not grow with the table.
+    """
+    rows = repository.iterate_public()
+    if format == "csv":
+        return StreamingResponse(
+            iter_csv(rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="users.csv"'},
+        )
+    return StreamingResponse(iter_ndjson(rows), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/users/search",
+    response_model=List[UserFromDB],
+    response_class=FastJSONResponse,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_user)],
+)
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=100),
+    pagination: Tuple[int, int] = Depends(pagination),
+    repository: UserRepository = Depends(get_read_user_repository),
+):
+    """
+    This endpoint allow to find users by the beginning of the words in their name,
+    last name or email, best matches first. Every word of the query must match.
+    """
+    skip, limit = pagination
+    rows = await repository.search(
+        q, skip=skip, limit=limit, candidates=settings.SEARCH_CANDIDATES
+    )
+    return FastJSONResponse([public_record(row) for row in rows])
+
+
+@router.get(
+    "/users/batch",
+    response_model=List[BatchUser],
+    response_class=FastJSONResponse,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_user)],
+)
+async def get_users_batch(
+    user_ids: List[int] = Depends(batch_ids),
+    repository: UserRepository = Depends(get_read_user_repository),
+):
+    """
+    This endpoint allow to get many users at once by their ids, e.g. `?ids=1,2,3`.
+    Users are returned in the requested order, missing ones with `found` false.
+    """
+    users = await repository.get_public_many(user_ids)
+    return FastJSONResponse(
+        [
+            {"id": user_id, "found": user_id in users, "user": users.get(user_id)}
+            for user_id in user_ids
+        ]
+    )
+
+
+@router.post(
+    "/users/batch",
+    response_model=List[BatchOperationResult],
+    response_class=FastJSONResponse,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_user)],
+)
+async def update_users_batch(
+    batch: UserBatch,
+    repository: UserRepository = Depends(get_user_repository),
+):
+    """
+    This endpoint allow administrators to update and delete many users at once.
+    Every operation is applied in a single transaction: if any user does not exist,
+    or an update takes an email already in use, nothing is changed. New passwords
+    and deletes revoke the users' tokens.
+    """
+    updates = {
+        operation.id: operation.data.dict(exclude_unset=True)
+        for operation in batch.operations
+        if operation.op == BatchOperationType.update
+    }
+    deletes = [
+        operation.id
+        for operation in batch.operations
+        if operation.op == BatchOperationType.delete
+    ]
+    # hashing every new password in one job per worker
+    new_passwords = [
+        (user_id, values.pop("password"))
+        for user_id, values in updates.items()
+        if "password" in values
+    ]
+    hashes = await password_hasher.hash_many(
+        [password for _, password in new_passwords]
+    )
+    for (user_id, _), password_hash in zip(new_passwords, hashes):
+        updates[user_id]["password_hash"] = password_hash
+
+    rows = {}
+    revoked_versions = {}
+    async with repository.database.transaction():
+        for user_id, values in updates.items():
+            new_password = "password_hash" in values
+            try:
+                row = await repository.update(
+                    user_id, values, revoke_tokens=new_password
+                )
+            except EmailTaken as error:
+                # leaving the transaction with an error rolls every change back
+                raise HTTPException(
+                    status_code=error.status_code,
+                    detail=[{"id": user_id, "msg": error.detail}],
+                ) from error
+            if row is None:
+                continue
+            rows[user_id] = row
+            if new_password:
+                revoked_versions[user_id] = row["token_version"]
+        deleted = set(await repository.delete_many(deletes))
+        missing = [
+            operation.id
+            for operation in batch.operations
+            if operation.id not in rows and operation.id not in deleted
+        ]
+        if missing:
+            # leaving the transaction with an error rolls every change back
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=[
+                    {"id": user_id, "msg": "User not found!"} for user_id in missing
+                ],
+            )
+        revoked_versions.update({user_id: DELETED for user_id in deleted})
+        await revoke_users_tokens(repository, revoked_versions)
+    for operation in batch.operations:
+        principal_cache.invalidate_user(operation.id)
+
+    return FastJSONResponse(
+        [
+            {
+                "op": operation.op.value,
+                "id": operation.id,
+                "user": (
+                    public_record(rows[operation.id]) if operation.id in rows else None
+                ),
+            }
+            for operation in batch.operations
+        ]
+    )
 
 
 @router.get(
     "/users/{id}",
     response_model=UserFromDB,
+    response_class=FastJSONResponse,
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(get_current_user)],
 )
-async def get_single_user(id: int, db: Session = Depends(get_db)):
+async def get_single_user(
+    id: int,
+    request: Request,
+    repository: UserRepository = Depends(get_read_user_repository),
+):
     """
     This endpoint allow to confirm an account by accessing to a link send to the email provided.
     If link is valid the user will be allowed to access, in the other hand, access will be forbidden
     """
-    user: UserFromDB = get_user_or_404(id, db)
-    return user
+    # A client revalidating its copy only needs the version to get a 304
+    if is_conditional(request):
+        version = await repository.get_version(id)
+        if version is not None:
+            check_not_modified(
+                request,
+                user_validators(
+                    id,
+                    version["row_version"],
+                    version["updated_at"],
+                    version["creation_date"],
+                ),
+            )
+    row = await get_user_or_404(id, repository)
+    validators = user_validators(
+        id, row["row_version"], row["updated_at"], row["creation_date"]
+    )
+    return FastJSONResponse(public_record(row), headers=validators.headers())
 
 
 @router.get(
@@ -69,46 +292,39 @@ async def get_single_user(id: int, db: Session = Depends(get_db)):
     response_class=HTMLResponse,
     status_code=status.HTTP_200_OK,
 )
-async def confirm_an_account(token: str, db: Session = Depends(get_db)):
+async def confirm_an_account(
+    token: str,
+    repository: UserRepository = Depends(get_user_repository),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     This endpoint allow to confirm an account by accessing to a link send to the email provided.
     If link is valid the user will be allowed to access, in the other hand, access will be forbidden.
     """
-    base_dir = os.path.abspath(os.path.dirname(__file__))
-    confirm_email_template = os.path.join(
-        base_dir, "templates", "ConfirmationEmail.html"
-    )
-    not_confirm_email_template = os.path.join(
-        base_dir, "templates", "ConfirmationEmailFailed.html"
-    )
-
     try:
         email = serializer.loads(token, salt="email-confirm-salt", max_age=3600)
-        user: User = get_user_by_email_or_404(email, db)
-        user.email_confirm = True
-        db.commit()
-        db.refresh(user)
+        user_id = await repository.confirm(email)
+        if user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="user email not found!"
+            )
+        principal_cache.invalidate_user(user_id)
 
-        with open(confirm_email_template, "r") as file:
-            html = file.read()
-
-        return html.replace("{{email}}", email)
+        html = page_templates["ConfirmationEmail.html"](email=email)
+        return HTMLResponse(html, headers={"Cache-Control": "no-store"})
 
     except SignatureExpired:
-        with open(not_confirm_email_template, "r") as file:
-            html = file.read()
-        return html.replace("{{msg}}", "Confirmation link has expired")
+        return confirmation_expired_page.response(if_none_match)
 
     except BadSignature:
-        with open(not_confirm_email_template, "r") as file:
-            html = file.read()
-        return html.replace("{{msg}}", "Invalid token provided")
+        return confirmation_invalid_page.response(if_none_match)
 
 
 @router.post(
     "/users/get-email-confirmation",
     response_model=Message,
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(account_gate)],
 )
 async def another_email_confirmation_token(
     request: Request,
@@ -119,90 +335,158 @@ async def another_email_confirmation_token(
     # Url to confrim
     confirm_url = f"{request.base_url}api/v1/users/confirm-email/{token}"
 
-    # send mail
-    await send_email(
+    # queue mail
+    await enqueue_email(
         emails=user.email,
         subject="Email Confirmation",
         confirm_url=confirm_url,
     )
+    outbox_worker.notify()
     return Message(
         message="Please check your email to confirm your registration with a new token."
     )
 
 
 @router.post(
-    "/users/register", status_code=status.HTTP_201_CREATED, response_model=Message
+    "/users/register",
+    status_code=status.HTTP_201_CREATED,
+    response_model=Message,
+    dependencies=[Depends(account_gate)],
 )
 async def create_an_account(
     request: Request,
     user_info_sent: UserCreate,
-    db: Session = Depends(get_db),
+    repository: UserRepository = Depends(get_user_repository),
 ):
     """
     This endpoint allow to create an account by passing a valid email and password
     """
-    # verify if email is in database
-    user: User = db.query(User).filter_by(email=user_info_sent.email).one_or_none()
-    if user is not None:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="This email already exists!",
-        )
     # Generar token
     token = serializer.dumps(user_info_sent.email, salt="email-confirm-salt")
     # Url to confrim
     confirm_url = f"{request.base_url}api/v1/users/confirm-email/{token}"
 
     # create a new user
-    new_user = User(**user_info_sent.dict())
-    db.add(new_user)
-    db.commit()
-
-    # Enviar correo
-    await send_email(
-        emails=user_info_sent.email,
-        subject="Email Confirmation",
-        confirm_url=confirm_url,
-    )
+    new_user = User(**user_info_sent.dict(exclude={"password"}))
+    await new_user.set_password_async(user_info_sent.password)
+    async with repository.database.transaction():
+        # The unique email index rejects existing emails, no lookup needed
+        if await repository.create(new_user) is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="This email already exists!",
+            )
+        # Queue the email with the user so both commit or neither does
+        await enqueue_email(
+            emails=user_info_sent.email,
+            subject="Email Confirmation",
+            confirm_url=confirm_url,
+        )
+    outbox_worker.notify()
 
     return Message(message="Please check your email to confirm your registration.")
 
 
-@router.post("/users/token", response_model=AccessToken)
+@router.post(
+    "/users/import",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    dependencies=[Depends(get_current_user)],
+)
+async def import_accounts(
+    request: Request,
+    repository: UserRepository = Depends(get_user_repository),
+):
+    """
+    This endpoint allow to create many accounts at once from a streamed NDJSON body,
+    or CSV when sent with a text/csv content type. Rows are validated like a regular
+    registration, a confirmation email is queued for each created user and the
+    response is an NDJSON report with one result per row.
+    """
+
+    def confirm_url_for(email: str) -> str:
+        token = serializer.dumps(email, salt="email-confirm-salt")
+        return f"{request.base_url}api/v1/users/confirm-email/{token}"
+
+    # The whole upload is consumed before answering, results are spooled to disk
+    report = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        counts = await import_users(
+            request.stream(),
+            csv_format="csv" in request.headers.get("content-type", ""),
+            repository=repository,
+            confirm_url_for=confirm_url_for,
+            report=report,
+            batch_size=settings.IMPORT_BATCH_SIZE,
+            max_line_bytes=settings.IMPORT_MAX_LINE_BYTES,
+        )
+    except:
+        report.close()
+        raise
+    outbox_worker.notify()
+
+    return StreamingResponse(
+        iter_report(report),
+        media_type="application/x-ndjson",
+        headers={
+            "X-Import-Total": str(counts["total"]),
+            "X-Import-Created": str(counts["created"]),
+        },
+    )
+
+
+@router.post(
+    "/users/token",
+    response_model=AccessToken,
+    dependencies=[Depends(limit_login_attempts), Depends(login_gate)],
+)
 async def get_authorization_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    repository: UserRepository = Depends(get_user_repository),
 ):
     """
     This endpoint allow existing user get a token to avoid sending credential on each request
     """
     # Validate user credentials
-    user: User = get_user_by_email_or_404(form_data.username, db)
-    user.verify_password(form_data.password)
-    # if valid user return json with jwt token
-    access_token: AccessToken = create_jwt_token(data={"sub": user.email})
+    user: User = await get_user_by_email_or_404(form_data.username, repository)
+    await user.verify_password_async(form_data.password)
+    # if valid user return json with jwt token, and a refresh token to renew it
+    access_token: AccessToken = create_jwt_token(data=token_claims(user))
+    access_token.refresh_token = await issue_refresh_token(repository, user)
+
+    return access_token
+
+
+@router.post("/users/token/refresh", response_model=AccessToken)
+async def refresh_authorization_token(
+    refresh: RefreshTokenRequest,
+    repository: UserRepository = Depends(get_user_repository),
+):
+    """
+    This endpoint allow a user to get a new access token with its refresh token instead of its credentials.
+    Refresh tokens are single use, the response carries the one to use next time.
+    """
+    user, refresh_token = await rotate_refresh_token(repository, refresh.refresh_token)
+    access_token: AccessToken = create_jwt_token(data=token_claims(user))
+    access_token.refresh_token = refresh_token
 
     return access_token
 
 
 @router.post(
-    "/users/reset-password", response_model=Message, status_code=status.HTTP_200_OK
+    "/users/reset-password",
+    response_model=Message,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(account_gate)],
 )
 async def reset_password(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
+    repository: UserRepository = Depends(get_user_repository),
     client_url: str = Header(None),
 ):
     """
     This endpoint allow existing user update his info
     """
-
-    user: User = db.query(User).filter_by(email=user_update.email).one_or_none()
-
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This email does not exists!",
-        )
     # Get client url
     if client_url is None:
         raise HTTPException(
@@ -214,13 +498,19 @@ async def reset_password(
     # Url to confrim
     confirm_url = f"{client_url}/reset-password?token={token}&email={user_update.email}"
 
-    # send mail
-    await send_email(
+    # queue mail, only if the user exists
+    queued = await enqueue_email_for_user(
         emails=user_update.email,
         subject="Reset password",
         confirm_url=confirm_url,
         reset_password=True,
     )
+    if queued is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="This email does not exists!",
+        )
+    outbox_worker.notify()
 
     return Message(
         message="Please check your email. We send you a link to reset your password"
@@ -230,41 +520,52 @@ async def reset_password(
 @router.put(
     "/users/update/{id}",
     response_model=UserFromDB,
+    response_class=FastJSONResponse,
     dependencies=[Depends(get_current_user)],
 )
 async def update_account(
     id: int,
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
+    repository: UserRepository = Depends(get_user_repository),
 ):
     """
     This endpoint allow existing user update his info
     """
-    user_from_db: UserFromDB = get_user_or_404(id, db)
-    user: User = get_user_by_email_or_404(user_from_db.email, db)
     # taking not null values
     update_data = user_update.dict(exclude_unset=True)
-    # setting values to update the user
-    for key, value in update_data.items():
-        setattr(user, key, value)
-
-    db.commit()
-    db.refresh(user)
-
-    user = cast(UserFromDB, user.__dict__)
-
-    return user
+    # hashing a new password through the model setter
+    new_password = "password" in update_data
+    if new_password:
+        user = User()
+        await user.set_password_async(update_data.pop("password"))
+        update_data["password_hash"] = user.password_hash
+    # setting values to update the user, a new password revokes the old tokens
+    async with repository.database.transaction():
+        row = await repository.update(id, update_data, revoke_tokens=new_password)
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found!"
+            )
+        if new_password:
+            await revoke_user_tokens(repository, id, row["token_version"])
+    principal_cache.invalidate_user(id)
+
+    validators = user_validators(
+        id, row["row_version"], row["updated_at"], row["creation_date"]
+    )
+    return FastJSONResponse(public_record(row), headers=validators.headers())
 
 
 @router.patch(
     "/users/update-password/{token}",
     status_code=status.HTTP_200_OK,
     response_model=Message,
+    dependencies=[Depends(account_gate)],
 )
 async def update_password(
     token: str,
     user_update_password: UserUpdate,
-    db: Session = Depends(get_db),
+    repository: UserRepository = Depends(get_user_repository),
 ):
     """
     This endpoint allow existing user update his password
@@ -272,11 +573,18 @@ async def update_password(
 
     try:
         email = serializer.loads(token, salt="email-confirm-salt", max_age=3600)
-        user: User = get_user_by_email_or_404(email, db)
-        user.password = user_update_password.password
-
-        db.commit()
-        db.refresh(user)
+        user = User()
+        await user.set_password_async(user_update_password.password)
+
+        async with repository.database.transaction():
+            row = await repository.set_password(email, user.password_hash)
+            if row is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="user email not found!",
+                )
+            await revoke_user_tokens(repository, row["id"], row["token_version"])
+        principal_cache.invalidate_user(row["id"])
 
         return Message(message="Password reseted successfully!")
 
@@ -297,17 +605,17 @@ async def update_password(
 )
 async def delete_account(
     id: int,
-    db: Session = Depends(get_db),
+    repository: UserRepository = Depends(get_user_repository),
 ):
     """
     This endpoint is to delete users just by administrators.
     """
-    user = db.query(User).filter(User.id == id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
-    db.delete(user)
-    db.commit()
+    async with repository.database.transaction():
+        if not await repository.delete(id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            )
+        await revoke_user_tokens(repository, id)
+    principal_cache.invalidate_user(id)
 
     return None
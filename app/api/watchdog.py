@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+from app.utils.functions import get_current_user
+from app.utils.responses import FastJSONResponse
+from app.utils.watchdog import loop_watchdog
+
+router = APIRouter()
+
+
+@router.get(
+    "/debug/event-loop",
+    response_class=FastJSONResponse,
+    dependencies=[Depends(get_current_user)],
+    include_in_schema=False,
+)
+async def event_loop_report():
+    """
+    This endpoint exposes what blocked the event loop since startup: every
+    call site with its routes, stall count, total and longest stall and stack.
+    """
+    return FastJSONResponse(loop_watchdog.report())
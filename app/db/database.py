@@ -1,7 +1,15 @@
+import itertools
 import os
+import typing
+from contextlib import contextmanager
+from functools import lru_cache
+from contextvars import ContextVar
 import sqlalchemy
 from databases import Database
+from databases.backends.sqlite import SQLitePool
 from app.settings import settings
+from app.db.sqlite import PooledSQLitePool, PragmaConnection, is_memory_database
+from app.utils.metrics import db_queries, fingerprint, instrument_engine
 from sqlalchemy.orm import sessionmaker
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -11,19 +19,194 @@ DATABASE_URL = settings.DATABASE_URI or "sqlite:///" + os.path.join(
     basedir, "data-dev.sqlite"
 )
 
-database = Database(DATABASE_URL)
-sqlalchemy_engine = sqlalchemy.create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+
+# Set once the current request wrote to the primary, so its later reads see
+# that write instead of a replica that may not have it yet
+wrote_primary: ContextVar[bool] = ContextVar("wrote_primary", default=False)
+write_verbs = ("INSERT", "UPDATE", "DELETE")
+
+
+class TimedDatabase(Database):
+    """
+    Database recording the latency of each statement by its fingerprint and
+    the number of statements in flight.
+    """
+
+    def __init__(self, url, **options: typing.Any):
+        super().__init__(url, **options)
+        self.in_flight = 0
+
+    @contextmanager
+    def _statement(self, query):
+        label = fingerprint(query)
+        if label.startswith(write_verbs):
+            wrote_primary.set(True)
+        self.in_flight += 1
+        try:
+            with db_queries.time(label):
+                yield
+        finally:
+            self.in_flight -= 1
+
+    async def fetch_all(self, query, values: typing.Optional[dict] = None):
+        with self._statement(query):
+            return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values: typing.Optional[dict] = None):
+        with self._statement(query):
+            return await super().fetch_one(query, values)
+
+    async def fetch_val(
+        self, query, values: typing.Optional[dict] = None, column: typing.Any = 0
+    ):
+        with self._statement(query):
+            return await super().fetch_val(query, values, column=column)
+
+    async def execute(self, query, values: typing.Optional[dict] = None):
+        with self._statement(query):
+            return await super().execute(query, values)
+
+    async def execute_many(self, query, values: list):
+        with self._statement(query):
+            return await super().execute_many(query, values)
+
+    async def iterate(self, query, values: typing.Optional[dict] = None):
+        # Streams are not timed, the consumer sets their pace
+        self.in_flight += 1
+        try:
+            async for record in super().iterate(query, values):
+                yield record
+        finally:
+            self.in_flight -= 1
+
+    async def disconnect(self) -> None:
+        await super().disconnect()
+        pool = getattr(self._backend, "_pool", None)
+        if isinstance(pool, PooledSQLitePool):
+            await pool.close()
+
+
+def create_database(url: str) -> TimedDatabase:
+    """
+    Async database for `url`. SQLite connections get the configured pragmas
+    and, for file databases, are pooled instead of opened for every query.
+    """
+    if not url.startswith("sqlite"):
+        return TimedDatabase(url)
+    options = {"factory": PragmaConnection}
+    async_database = TimedDatabase(url, **options)
+    if not is_memory_database(async_database.url.database):
+        # databases has no pool option for SQLite, swap in our own. The pool
+        # lives in a private attribute, hence the pinned databases version
+        backend = async_database._backend
+        if not isinstance(getattr(backend, "_pool", None), SQLitePool):
+            raise RuntimeError(
+                "This databases version keeps no replaceable SQLite pool, "
+                "install the version pinned in requirements.txt"
+            )
+        backend._pool = PooledSQLitePool(
+            async_database.url,
+            size=settings.DATABASE_POOL_SIZE,
+            max_overflow=settings.DATABASE_MAX_OVERFLOW,
+            timeout=settings.DATABASE_POOL_TIMEOUT,
+            **options,
+        )
+    return async_database
+
+
+def create_sync_engine(url: str) -> sqlalchemy.engine.Engine:
+    if not url.startswith("sqlite"):
+        return sqlalchemy.create_engine(url)
+    connect_args = {"check_same_thread": False, "factory": PragmaConnection}
+    if is_memory_database(sqlalchemy.engine.make_url(url).database or ""):
+        return sqlalchemy.create_engine(url, connect_args=connect_args)
+    return sqlalchemy.create_engine(
+        url,
+        connect_args=connect_args,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+    )
+
+
+class ReplicaSet:
+    """
+    Picks the database serving a read: one of the replicas, by round-robin or
+    least in-flight statements, unless the current request already wrote to
+    the primary. Without replicas every read goes to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: TimedDatabase,
+        replicas: typing.List[TimedDatabase],
+        strategy: str = "round_robin",
+    ):
+        if strategy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.primary = primary
+        self.replicas = replicas
+        self.strategy = strategy
+        self._turn = itertools.count()
+
+    def for_read(self) -> TimedDatabase:
+        if not self.replicas or wrote_primary.get():
+            return self.primary
+        if self.strategy == "least_connections":
+            # Start from the next replica in turn so ties are spread out
+            start = next(self._turn) % len(self.replicas)
+            candidates = self.replicas[start:] + self.replicas[:start]
+            return min(candidates, key=lambda replica: replica.in_flight)
+        return self.replicas[next(self._turn) % len(self.replicas)]
+
+    async def connect(self) -> None:
+        for replica in self.replicas:
+            await replica.connect()
+
+    async def disconnect(self) -> None:
+        for replica in self.replicas:
+            await replica.disconnect()
+
+
+database = create_database(DATABASE_URL)
+replica_set = ReplicaSet(
+    database,
+    [
+        create_database(url.strip())
+        for url in settings.DATABASE_REPLICA_URIS.split(",")
+        if url.strip()
+    ],
+    settings.DATABASE_REPLICA_STRATEGY,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sqlalchemy_engine)
+
+
+@lru_cache(maxsize=None)
+def get_sync_engine() -> sqlalchemy.engine.Engine:
+    """
+    Blocking engine for migrations and scripts, created on first use since
+    request handlers only go through `database`.
+    """
+    engine = create_sync_engine(DATABASE_URL)
+    instrument_engine(engine)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_session_factory() -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_sync_engine())
 
 
 def get_database() -> Database:
     return database
 
 
+def get_read_database() -> Database:
+    """Database for read-only work, possibly a replica."""
+    return replica_set.for_read()
+
+
 def get_db():
-    db = SessionLocal()
+    db = get_session_factory()()
     try:
         yield db
     finally:
@@ -0,0 +1,116 @@
+import argparse
+import importlib
+import os
+import pkgutil
+from datetime import datetime, timezone
+from types import ModuleType
+from typing import List, Optional, Tuple
+from databases import Database
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Engine
+from app.db import migrations
+
+# Versioned migrations live in app/db/migrations as NNNN_description.py
+migrations_dir = os.path.dirname(migrations.__file__)
+
+metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255)),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+def load_migrations() -> List[Tuple[int, ModuleType]]:
+    found = []
+    for module in pkgutil.iter_modules([migrations_dir]):
+        prefix = module.name.split("_", 1)[0]
+        if prefix.isdigit():
+            found.append(
+                (
+                    int(prefix),
+                    importlib.import_module(f"{migrations.__name__}.{module.name}"),
+                )
+            )
+    return sorted(found, key=lambda item: item[0])
+
+
+def latest_version() -> int:
+    loaded = load_migrations()
+    return loaded[-1][0] if loaded else 0
+
+
+def current_version(engine: Engine) -> int:
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, schema_version.name):
+            return 0
+        version = connection.execute(select(func.max(schema_version.c.version)))
+        return version.scalar() or 0
+
+
+def migrate(engine: Engine, target: Optional[int] = None) -> List[int]:
+    """Applies every pending migration, each in its own transaction."""
+    metadata.create_all(engine, checkfirst=True)
+    applied = []
+    version = current_version(engine)
+    for number, module in load_migrations():
+        if number <= version or (target is not None and number > target):
+            continue
+        with engine.begin() as connection:
+            module.upgrade(connection)
+            connection.execute(
+                insert(schema_version).values(
+                    version=number,
+                    description=(module.__doc__ or "").strip()[:255],
+                    applied_at=datetime.now(timezone.utc),
+                )
+            )
+        applied.append(number)
+    return applied
+
+
+async def check_schema_version(database: Database) -> int:
+    """
+    Fails fast when the database is behind the code. This is the only
+    schema work done at startup, a single read of the schema_version table.
+    """
+    expected = latest_version()
+    try:
+        version = await database.fetch_val(select(func.max(schema_version.c.version)))
+    except Exception as error:
+        raise SchemaVersionError(
+            "Database has no schema_version table, run `python -m app.db.migrate`"
+        ) from error
+    if (version or 0) < expected:
+        raise SchemaVersionError(
+            f"Database schema is at version {version or 0} but the code expects "
+            f"{expected}, run `python -m app.db.migrate`"
+        )
+    return version
+
+
+def main() -> None:
+    from app.db.database import get_sync_engine
+
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--check", action="store_true", help="only report versions")
+    parser.add_argument("--target", type=int, help="stop at this version")
+    args = parser.parse_args()
+    sqlalchemy_engine = get_sync_engine()
+
+    if args.check:
+        print(f"current={current_version(sqlalchemy_engine)} latest={latest_version()}")
+        return
+    applied = migrate(sqlalchemy_engine, args.target)
+    print(f"applied={applied} current={current_version(sqlalchemy_engine)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Users and email outbox tables as they were created by create_all."""
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, String
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+users = Table(
+    "users",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(30)),
+    Column("last_name", String(30)),
+    Column("email", String(50)),
+    Column("password_hash", String(50)),
+    Column("email_confirm", String(50)),
+    Column("creation_date", DateTime),
+)
+
+email_outbox = Table(
+    "email_outbox",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("recipient", String(50), nullable=False),
+    Column("subject", String(100), nullable=False),
+    Column("confirm_url", String(500), nullable=False),
+    Column("reset_password", Boolean),
+    Column("status", String(10), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("next_attempt_at", DateTime, nullable=False),
+    Column("last_error", String(255)),
+    Column("created_at", DateTime, nullable=False),
+    Column("sent_at", DateTime),
+    Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    # Databases created by create_all already have these tables
+    metadata.create_all(connection, checkfirst=True)
@@ -0,0 +1,26 @@
+"""Unique index on users.email and indexes for the GET /users sort keys."""
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def upgrade(connection: Connection) -> None:
+    duplicates = (
+        connection.execute(
+            text("SELECT email FROM users GROUP BY email HAVING count(*) > 1")
+        )
+        .scalars()
+        .all()
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Cannot add a unique index on users.email, duplicated emails: "
+            + ", ".join(duplicates)
+        )
+    connection.execute(
+        text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)")
+    )
+    for column in ("name", "last_name", "creation_date"):
+        connection.execute(
+            text(f"CREATE INDEX IF NOT EXISTS ix_users_{column} ON users ({column})")
+        )
@@ -0,0 +1,29 @@
+"""Per user token version and the table of recent token revocations."""
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, Table
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+token_revocations = Table(
+    "token_revocations",
+    metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("token_version", Integer, nullable=False),
+    Column("revoked_at", DateTime, nullable=False),
+    Index("ix_token_revocations_revoked_at", "revoked_at"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    columns = {
+        column["name"] for column in connection.dialect.get_columns(connection, "users")
+    }
+    if "token_version" not in columns:
+        connection.execute(
+            text(
+                "ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+    metadata.create_all(connection, checkfirst=True)
@@ -0,0 +1,48 @@
+"""Full-text index over users name, last name and email, kept in sync by triggers."""
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+statements = (
+    # External content table: the index stores tokens only, rows stay in users.
+    # Prefix indexes let short typeahead prefixes skip merging many terms
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        name, last_name, email,
+        content='users', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3 4 5 6'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts (rowid, name, last_name, email)
+        VALUES (new.id, new.name, new.last_name, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name, last_name, email)
+        VALUES ('delete', old.id, old.name, old.last_name, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_update
+    AFTER UPDATE OF name, last_name, email ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name, last_name, email)
+        VALUES ('delete', old.id, old.name, old.last_name, old.email);
+        INSERT INTO users_fts (rowid, name, last_name, email)
+        VALUES (new.id, new.name, new.last_name, new.email);
+    END
+    """,
+    # Index the users that already exist
+    "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+)
+
+
+def upgrade(connection: Connection) -> None:
+    # Other databases search with prefix LIKE queries on the column indexes
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in statements:
+        connection.execute(text(statement))
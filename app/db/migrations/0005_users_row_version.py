@@ -0,0 +1,20 @@
+"""Row version and last update time of users, validators for conditional GETs."""
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def upgrade(connection: Connection) -> None:
+    columns = {
+        column["name"] for column in connection.dialect.get_columns(connection, "users")
+    }
+    if "row_version" not in columns:
+        connection.execute(
+            text("ALTER TABLE users ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1")
+        )
+    if "updated_at" not in columns:
+        connection.execute(text("ALTER TABLE users ADD COLUMN updated_at DATETIME"))
+    # Rows never updated so far were last modified when created
+    connection.execute(
+        text("UPDATE users SET updated_at = creation_date WHERE updated_at IS NULL")
+    )
@@ -0,0 +1,21 @@
+"""Hashed refresh tokens, renewing access tokens without a password."""
+
+from sqlalchemy import Column, DateTime, Index, Integer, LargeBinary, MetaData, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+refresh_tokens = Table(
+    "refresh_tokens",
+    metadata,
+    Column("token_hash", LargeBinary(32), primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("token_version", Integer, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Index("ix_refresh_tokens_user_id", "user_id"),
+    Index("ix_refresh_tokens_expires_at", "expires_at"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.create_all(connection, checkfirst=True)
@@ -0,0 +1,493 @@
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+from databases import Database
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import and_, delete, func, insert, or_, select, text, update
+from app.db.database import get_database, get_read_database
+from app.models.models import RefreshToken, TokenRevocation, User
+
+users_table = User.__table__
+revocations_table = TokenRevocation.__table__
+refresh_tokens_table = RefreshToken.__table__
+# Columns safe to hand out to API clients
+public_fields = ("id", "name", "last_name", "email", "email_confirm")
+public_columns = [users_table.c[field] for field in public_fields]
+# Validators of a user representation, see app.utils.conditional
+version_columns = [
+    users_table.c.row_version,
+    func.coalesce(users_table.c.updated_at, users_table.c.creation_date).label(
+        "updated_at"
+    ),
+    # Tells apart users given the id of a deleted one
+    users_table.c.creation_date,
+]
+
+
+class EmailTaken(HTTPException):
+    """The unique email index rejected a write, answered like registration."""
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="This email already exists!",
+        )
+
+
+def is_unique_violation(error: Exception, column) -> bool:
+    """Whether `error` is the unique index on `column` rejecting a write."""
+    # sqlite3 and asyncpg both name the column, or its index, in the message
+    if isinstance(error, sqlite3.IntegrityError) or (
+        type(error).__name__ == "UniqueViolationError"
+    ):
+        return column.name in str(error)
+    return False
+
+
+def to_bool(value: Any) -> bool:
+    """email_confirm is stored in a string column, as "0"/"1" on SQLite."""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def public_record(row: Mapping) -> dict:
+    """Public fields of a trusted user row, ready to be encoded as JSON."""
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "last_name": row["last_name"],
+        "email": row["email"],
+        "email_confirm": to_bool(row["email_confirm"]),
+    }
+
+
+# Words of a search query, anything else (quotes, operators...) is dropped
+search_term = re.compile(r"\w+")
+
+
+def search_terms(query: str, max_terms: int = 8) -> List[str]:
+    return search_term.findall(query.lower())[:max_terms]
+
+
+def touched(now: Optional[datetime] = None) -> dict:
+    """Values every UPDATE of users sets, so cached representations go stale."""
+    return {
+        "row_version": users_table.c.row_version + 1,
+        "updated_at": now or datetime.now(timezone.utc),
+    }
+
+
+def insert_ignoring_conflicts(database: Database, table, index_elements: List[str]):
+    """
+    INSERT that silently skips rows violating the unique index on
+    `index_elements`, on the dialects that support ON CONFLICT DO NOTHING.
+    """
+    upsert_insert = dialect_insert(database)
+    if upsert_insert is None:
+        return insert(table)
+    return upsert_insert(table).on_conflict_do_nothing(index_elements=index_elements)
+
+
+def dialect_insert(database: Database):
+    """The dialect specific insert construct, None if it has no ON CONFLICT."""
+    dialect = database.url.dialect
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+class UserRepository:
+    """
+    Async access to the users table through the shared `databases.Database`,
+    so route handlers never run blocking queries on the event loop.
+    """
+
+    def __init__(self, database: Database):
+        self.database = database
+
+    @staticmethod
+    def _to_user(row) -> Optional[User]:
+        if row is None:
+            return None
+        # Transient instance: keeps attribute access and verify_password
+        return User(**dict(row._mapping))
+
+    async def get_by_id(self, user_id: int) -> Optional[User]:
+        query = select(users_table).where(users_table.c.id == user_id)
+        return self._to_user(await self.database.fetch_one(query))
+
+    async def get_versioned_by_id(self, user_id: int) -> Optional[Mapping]:
+        """Public columns of the user plus its version columns."""
+        query = select(*public_columns, *version_columns)
+        return await self.database.fetch_one(query.where(users_table.c.id == user_id))
+
+    async def get_version(self, user_id: int) -> Optional[Mapping]:
+        """Only the version columns, to answer conditional requests."""
+        query = select(*version_columns).where(users_table.c.id == user_id)
+        return await self.database.fetch_one(query)
+
+    async def get_public_many(self, user_ids: List[int]) -> Dict[int, dict]:
+        """Public records of the existing users among `user_ids`, by id."""
+        if not user_ids:
+            return {}
+        query = select(*public_columns).where(users_table.c.id.in_(set(user_ids)))
+        rows = await self.database.fetch_all(query)
+        return {row["id"]: public_record(row) for row in rows}
+
+    async def get_by_email(self, email: str) -> Optional[User]:
+        query = select(users_table).where(users_table.c.email == email)
+        return self._to_user(await self.database.fetch_one(query))
+
+    async def list(
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        sort: str = "id",
+        after: Optional[Tuple[Any, int]] = None,
+        email_confirm: Optional[bool] = None,
+        versions_only: bool = False,
+    ) -> List[Mapping]:
+        """
+        Lists the public columns of users, plus the sort column and the
+        version columns, ordered by `sort` with the id as tiebreak. When
+        `after` holds the (sort value, id) of the last row already seen, the
+        page starts right after it (keyset pagination) and `skip` is ignored.
+        `versions_only` selects just the ids and version columns of the page.
+        """
+        column = users_table.c[sort]
+        id_column = users_table.c.id
+        if versions_only:
+            columns = [id_column, *version_columns]
+        else:
+            columns = [*public_columns, *version_columns]
+            if sort not in public_fields:
+                columns.append(column)
+        query = select(*columns)
+        if email_confirm is not None:
+            query = query.where(users_table.c.email_confirm == email_confirm)
+        if after is not None:
+            value, last_id = after
+            if column is id_column:
+                query = query.where(id_column > last_id)
+            else:
+                query = query.where(
+                    or_(column > value, and_(column == value, id_column > last_id))
+                )
+        elif skip:
+            query = query.offset(skip)
+        if column is id_column:
+            query = query.order_by(id_column)
+        else:
+            query = query.order_by(column, id_column)
+        return await self.database.fetch_all(query.limit(limit))
+
+    async def search(
+        self, query: str, skip: int = 0, limit: int = 10, candidates: int = 200
+    ) -> List[Mapping]:
+        """
+        Users whose name, last name or email contain a word starting with each
+        word of `query`, best matches first. Uses the users_fts index on
+        SQLite and prefix LIKE filters elsewhere.
+        """
+        terms = search_terms(query)
+        if not terms or not limit:
+            return []
+        if self.database.url.dialect != "sqlite":
+            conditions = [
+                or_(
+                    *(
+                        column.startswith(term, autoescape=True)
+                        for column in (
+                            users_table.c.name,
+                            users_table.c.last_name,
+                            users_table.c.email,
+                        )
+                    )
+                )
+                for term in terms
+            ]
+            statement = (
+                select(*public_columns)
+                .where(*conditions)
+                .order_by(users_table.c.name, users_table.c.id)
+                .offset(skip)
+                .limit(limit)
+            )
+            return await self.database.fetch_all(statement)
+
+        # Every term must match as a prefix; names weigh more than the email.
+        # The index keeps only the `candidates` best matches in a bounded
+        # sort, so only those are joined to users even for broad prefixes
+        # such as a single letter. Ties go to the lowest id, so pages are
+        # stable between requests
+        match = " ".join(f'"{term}"*' for term in terms)
+        statement = text(
+            "SELECT users.id, users.name, users.last_name, users.email,"
+            " users.email_confirm"
+            " FROM ("
+            "  SELECT rowid, bm25(users_fts, 2.0, 2.0, 1.0) AS score"
+            "  FROM users_fts WHERE users_fts MATCH :match"
+            "  ORDER BY score, rowid LIMIT :candidates"
+            " ) AS hits JOIN users ON users.id = hits.rowid"
+            " ORDER BY hits.score, users.id"
+            " LIMIT :limit OFFSET :skip"
+        ).bindparams(
+            match=match,
+            candidates=max(candidates, skip + limit),
+            limit=limit,
+            skip=skip,
+        )
+        return await self.database.fetch_all(statement)
+
+    def iterate_public(self) -> AsyncIterator[Mapping]:
+        """
+        Streams the public columns of every user in id order from a single
+        cursor, without loading the table into memory.
+        """
+        query = select(*public_columns).order_by(users_table.c.id)
+        return self.database.iterate(query)
+
+    async def create(self, user: User) -> Optional[int]:
+        """
+        Inserts the user and returns its id, or None when the email is
+        already taken. The unique index decides, so there is no race between
+        checking the email and inserting.
+        """
+        creation_date = user.creation_date or datetime.now(timezone.utc)
+        query = (
+            insert_ignoring_conflicts(self.database, users_table, ["email"])
+            .values(
+                name=user.name,
+                last_name=user.last_name,
+                email=user.email,
+                password_hash=user.password_hash,
+                email_confirm=user.email_confirm or False,
+                creation_date=creation_date,
+                updated_at=creation_date,
+            )
+            .returning(users_table.c.id)
+        )
+        return await self.database.fetch_val(query)
+
+    async def create_many(self, users: List[User]) -> Dict[str, int]:
+        """
+        Inserts the users with a single multi-row statement. Emails that
+        already exist are skipped; returns the ids of the inserted rows by email.
+        """
+        if not users:
+            return {}
+        now = datetime.now(timezone.utc)
+        query = (
+            insert_ignoring_conflicts(self.database, users_table, ["email"])
+            .values(
+                [
+                    {
+                        "name": user.name,
+                        "last_name": user.last_name,
+                        "email": user.email,
+                        "password_hash": user.password_hash,
+                        "email_confirm": False,
+                        "creation_date": now,
+                        "updated_at": now,
+                    }
+                    for user in users
+                ]
+            )
+            .returning(users_table.c.id, users_table.c.email)
+        )
+        rows = await self.database.fetch_all(query)
+        return {row["email"]: row["id"] for row in rows}
+
+    async def update(
+        self, user_id: int, values: dict, revoke_tokens: bool = False
+    ) -> Optional[Mapping]:
+        """
+        Updates the user and returns its public and version columns plus
+        token_version, or None if it does not exist. `revoke_tokens` bumps the token version
+        in the same statement. Raises EmailTaken when the new email belongs to
+        another user.
+        """
+        if revoke_tokens:
+            values = {**values, "token_version": users_table.c.token_version + 1}
+        if not values:
+            query = select(
+                *public_columns, *version_columns, users_table.c.token_version
+            )
+            return await self.database.fetch_one(
+                query.where(users_table.c.id == user_id)
+            )
+        query = (
+            update(users_table)
+            .where(users_table.c.id == user_id)
+            .values(**values, **touched())
+            .returning(
+                *public_columns,
+                users_table.c.row_version,
+                users_table.c.updated_at,
+                users_table.c.creation_date,
+                users_table.c.token_version,
+            )
+        )
+        try:
+            return await self.database.fetch_one(query)
+        except Exception as error:
+            if is_unique_violation(error, users_table.c.email):
+                raise EmailTaken() from error
+            raise
+
+    async def set_password(self, email: str, password_hash: str) -> Optional[Mapping]:
+        """
+        Replaces the password of the user with `email` and revokes its tokens.
+        Returns the id and new token_version, or None if there is no such user.
+        """
+        query = (
+            update(users_table)
+            .where(users_table.c.email == email)
+            .values(
+                password_hash=password_hash,
+                token_version=users_table.c.token_version + 1,
+                **touched(),
+            )
+            .returning(users_table.c.id, users_table.c.token_version)
+        )
+        return await self.database.fetch_one(query)
+
+    async def delete(self, user_id: int) -> bool:
+        query = (
+            delete(users_table)
+            .where(users_table.c.id == user_id)
+            .returning(users_table.c.id)
+        )
+        return await self.database.fetch_val(query) is not None
+
+    async def delete_many(self, user_ids: List[int]) -> List[int]:
+        """Deletes the users with a single statement, returns the deleted ids."""
+        if not user_ids:
+            return []
+        query = (
+            delete(users_table)
+            .where(users_table.c.id.in_(set(user_ids)))
+            .returning(users_table.c.id)
+        )
+        return [row["id"] for row in await self.database.fetch_all(query)]
+
+    async def confirm(self, email: str) -> Optional[int]:
+        """Marks the email as confirmed, returns the user id or None."""
+        query = (
+            update(users_table)
+            .where(users_table.c.email == email)
+            .values(email_confirm=True, **touched())
+            .returning(users_table.c.id)
+        )
+        return await self.database.fetch_val(query)
+
+    async def revoke_tokens(self, user_id: int, token_version: int) -> datetime:
+        """
+        Records that the user's tokens older than `token_version` are revoked
+        and returns the revocation time. The caller bumps users.token_version.
+        """
+        return await self.revoke_tokens_many({user_id: token_version})
+
+    async def revoke_tokens_many(self, token_versions: Dict[int, int]) -> datetime:
+        """
+        Same as `revoke_tokens` for several users, {user_id: token_version},
+        with a single statement where the dialect supports upserts.
+        """
+        revoked_at = datetime.now(timezone.utc)
+        values = [
+            {"user_id": user_id, "token_version": version, "revoked_at": revoked_at}
+            for user_id, version in token_versions.items()
+        ]
+        if not values:
+            return revoked_at
+        upsert_insert = dialect_insert(self.database)
+        if upsert_insert is None:
+            await self.database.execute(
+                delete(revocations_table).where(
+                    revocations_table.c.user_id.in_(list(token_versions))
+                )
+            )
+            await self.database.execute(insert(revocations_table).values(values))
+            return revoked_at
+        query = upsert_insert(revocations_table).values(values)
+        query = query.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                "token_version": query.excluded.token_version,
+                "revoked_at": query.excluded.revoked_at,
+            },
+        )
+        await self.database.execute(query)
+        return revoked_at
+
+    async def revocations_since(self, since: datetime) -> List[Mapping]:
+        query = select(revocations_table).where(revocations_table.c.revoked_at >= since)
+        return await self.database.fetch_all(query)
+
+    async def prune_revocations(self, before: datetime) -> None:
+        query = delete(revocations_table).where(revocations_table.c.revoked_at < before)
+        await self.database.execute(query)
+
+    async def add_refresh_token(
+        self, user_id: int, token_version: int, token_hash: bytes, expires_at: datetime
+    ) -> None:
+        query = insert(refresh_tokens_table).values(
+            token_hash=token_hash,
+            user_id=user_id,
+            token_version=token_version,
+            expires_at=expires_at,
+        )
+        await self.database.execute(query)
+
+    async def take_refresh_token(
+        self, token_hash: bytes, now: Optional[datetime] = None
+    ) -> Optional[Mapping]:
+        """
+        Deletes the unexpired refresh token and returns its user_id,
+        token_version and expires_at, or None. Only one of several concurrent
+        renewals with the same token gets the row.
+        """
+        query = (
+            delete(refresh_tokens_table)
+            .where(
+                refresh_tokens_table.c.token_hash == token_hash,
+                refresh_tokens_table.c.expires_at > (now or datetime.now(timezone.utc)),
+            )
+            .returning(
+                refresh_tokens_table.c.user_id,
+                refresh_tokens_table.c.token_version,
+                refresh_tokens_table.c.expires_at,
+            )
+        )
+        return await self.database.fetch_one(query)
+
+    async def delete_refresh_tokens(self, user_ids: List[int]) -> None:
+        if not user_ids:
+            return
+        query = delete(refresh_tokens_table).where(
+            refresh_tokens_table.c.user_id.in_(set(user_ids))
+        )
+        await self.database.execute(query)
+
+    async def prune_refresh_tokens(self, before: datetime) -> None:
+        query = delete(refresh_tokens_table).where(
+            refresh_tokens_table.c.expires_at <= before
+        )
+        await self.database.execute(query)
+
+
+def get_user_repository(database: Database = Depends(get_database)) -> UserRepository:
+    return UserRepository(database)
+
+
+def get_read_user_repository(
+    database: Database = Depends(get_read_database),
+) -> UserRepository:
+    """Repository for read-only routes, served by a replica when configured."""
+    return UserRepository(database)
@@ -0,0 +1,130 @@
+import asyncio
+import sqlite3
+from collections import deque
+from typing import Deque, List, Optional
+import aiosqlite
+from databases.backends.sqlite import SQLitePool
+from app.settings import settings
+
+
+def sqlite_pragmas() -> List[str]:
+    """Connection-time pragmas of the configured SQLite profile."""
+    pragmas = {
+        # Readers no longer block the writer, nor the writer the readers
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        # Durable on application crash, fsyncs only at WAL checkpoints
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        # Negative values are in KiB rather than pages
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+    return [
+        f"PRAGMA {name} = {value}"
+        for name, value in pragmas.items()
+        if value is not None and value != ""
+    ]
+
+
+class PragmaConnection(sqlite3.Connection):
+    """sqlite3 connection factory applying the profile pragmas when opened."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for pragma in sqlite_pragmas():
+            self.execute(pragma).close()
+
+    def execute(self, sql, *args):
+        # databases opens every transaction with a bare, deferred BEGIN. The
+        # app only opens transactions to write, and a deferred transaction
+        # upgrading its read lock mid-way (as the users FTS triggers do)
+        # fails at once with SQLITE_BUSY instead of waiting busy_timeout.
+        # Take the write lock up front so concurrent writers queue instead
+        if sql == "BEGIN":
+            sql = "BEGIN IMMEDIATE"
+        return super().execute(sql, *args)
+
+
+def is_memory_database(database: str) -> bool:
+    return database in ("", ":memory:") or "mode=memory" in database
+
+
+class PooledSQLitePool(SQLitePool):
+    """
+    Keeps up to `size` aiosqlite connections, each with its worker thread,
+    open between queries instead of opening one per query, and caps the
+    connections in use at `size + max_overflow`. Callers over the cap wait
+    up to `timeout` seconds for one to be released.
+    """
+
+    def __init__(
+        self,
+        url,
+        size: int,
+        max_overflow: int,
+        timeout: float,
+        **options,
+    ):
+        super().__init__(url, **options)
+        self.size = max(1, size)
+        self.max_overflow = max(0, max_overflow)
+        self.timeout = timeout
+        self._idle: Deque[aiosqlite.Connection] = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size + self.max_overflow)
+        return self._slots
+
+    async def _acquire_slot(self) -> None:
+        slots = self._get_slots()
+        if not slots.locked():
+            await slots.acquire()
+            return
+        # Not asyncio.wait_for: before Python 3.12 it swallows a cancellation
+        # arriving as the slot is granted, and the cancelled task carries on
+        acquiring = asyncio.ensure_future(slots.acquire())
+        try:
+            done, _ = await asyncio.wait({acquiring}, timeout=self.timeout)
+        except asyncio.CancelledError:
+            if not acquiring.cancel() and not acquiring.cancelled():
+                slots.release()
+            raise
+        if not done:
+            if not acquiring.cancel() and not acquiring.cancelled():
+                slots.release()
+            raise TimeoutError(
+                f"No database connection available after {self.timeout} seconds"
+            )
+
+    async def acquire(self) -> aiosqlite.Connection:
+        await self._acquire_slot()
+        try:
+            if self._idle:
+                return self._idle.pop()
+            return await super().acquire()
+        except BaseException:
+            self._get_slots().release()
+            raise
+
+    async def release(self, connection: aiosqlite.Connection) -> None:
+        try:
+            if connection.in_transaction:
+                # Left over by a failed transaction, never hand it out dirty
+                await connection.rollback()
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+            await super().release(connection)
+        except (sqlite3.Error, ValueError):
+            # Broken or already closed connection, drop it
+            await super().release(connection)
+        finally:
+            self._get_slots().release()
+
+    async def close(self) -> None:
+        while self._idle:
+            await super().release(self._idle.pop())
+        self._slots = None
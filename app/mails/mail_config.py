@@ -1,47 +1,70 @@
-from fastapi import HTTPException, status
+import asyncio
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional
 from app.settings import mail_config
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
+from app.mails.pool import SMTPConnectionPool
+from app.utils.templates import load_template
 import os
 
+base_dir = os.path.abspath(os.path.dirname(__file__))
 
-async def send_email(
-    emails, subject: str, confirm_url: str, reset_password: bool = False
-):
-    config_to_send_mails = ConnectionConfig(
-        MAIL_USERNAME=mail_config.MAIL_USERNAME,
-        MAIL_PASSWORD=mail_config.MAIL_PASSWORD,
-        MAIL_FROM=mail_config.MAIL_FROM,
-        MAIL_PORT=mail_config.MAIL_PORT,
-        MAIL_SERVER=mail_config.MAIL_SERVER,
-        MAIL_STARTTLS=mail_config.MAIL_STARTTLS,
-        MAIL_SSL_TLS=mail_config.MAIL_SSL_TLS,
-        USE_CREDENTIALS=mail_config.USE_CREDENTIALS,
-        VALIDATE_CERTS=mail_config.VALIDATE_CERTS,
-    )
-    base_dir = os.path.abspath(os.path.dirname(__file__))
-    template_to_use = (
-        "ConfirmAccount.html" if not reset_password else "ResetPassword.html"
-    )
+# Shared by every send, connections are opened lazily and kept alive
+smtp_pool = SMTPConnectionPool(
+    hostname=mail_config.MAIL_SERVER,
+    port=mail_config.MAIL_PORT,
+    username=mail_config.MAIL_USERNAME,
+    password=mail_config.MAIL_PASSWORD,
+    use_tls=mail_config.MAIL_SSL_TLS,
+    start_tls=mail_config.MAIL_STARTTLS,
+    validate_certs=mail_config.VALIDATE_CERTS,
+    use_credentials=mail_config.USE_CREDENTIALS,
+    size=mail_config.MAIL_POOL_SIZE,
+    idle_seconds=mail_config.MAIL_POOL_IDLE_SECONDS,
+    timeout=mail_config.MAIL_TIMEOUT,
+)
+# Render functions keyed by reset_password
+templates: Dict[bool, Callable[..., str]] = {}
+
+
+def load_templates() -> None:
+    templates[False] = load_template(os.path.join(base_dir, "ConfirmAccount.html"))
+    templates[True] = load_template(os.path.join(base_dir, "ResetPassword.html"))
+
+
+async def start_mail() -> None:
+    load_templates()
 
-    template_path = os.path.join(base_dir, template_to_use)
 
-    with open(template_path, "r") as file:
-        html = file.read()
+async def stop_mail() -> None:
+    await smtp_pool.close()
 
-    html = html.replace("{{url}}", confirm_url)
-    body = html.replace("{{email}}", emails)
-    message = MessageSchema(
-        subject=f"{mail_config.MAIL_SUBJECT_PREFIX} {subject}",
-        recipients=[emails],
-        body=body,
-        subtype="html",
+
+def render_email(emails: str, confirm_url: str, reset_password: bool = False) -> str:
+    if not templates:
+        load_templates()
+    return templates[reset_password](url=confirm_url, email=emails)
+
+
+def build_message(
+    emails: str, subject: str, confirm_url: str, reset_password: bool = False
+) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = f"{mail_config.MAIL_SUBJECT_PREFIX} {subject}"
+    message["From"] = mail_config.MAIL_FROM
+    message["To"] = emails
+    message.set_content(
+        render_email(emails, confirm_url, reset_password), subtype="html"
     )
+    return message
 
-    fast_mail = FastMail(config_to_send_mails)
-    try:
-        await fast_mail.send_message(message)
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Server Error! Email could not be sent",
-        )
+
+async def send_many(messages: List[EmailMessage]) -> List[Optional[Exception]]:
+    """
+    Sends the messages concurrently through the pooled SMTP connections and
+    returns, in order, the error raised for each message or None when it was
+    delivered.
+    """
+    results = await asyncio.gather(
+        *(smtp_pool.send(message) for message in messages), return_exceptions=True
+    )
+    return [result if isinstance(result, Exception) else None for result in results]
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import insert, literal, select, update
+from app.db.database import get_database
+from app.mails.mail_config import build_message, send_many
+from app.models.models import EmailOutbox, User
+from app.settings import mail_config
+
+logger = logging.getLogger(__name__)
+
+outbox_table = EmailOutbox.__table__
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+
+def outbox_row(
+    emails: str, subject: str, confirm_url: str, reset_password: bool = False
+) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "recipient": emails,
+        "subject": subject,
+        "confirm_url": confirm_url,
+        "reset_password": reset_password,
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+
+
+async def enqueue_email(
+    emails: str, subject: str, confirm_url: str, reset_password: bool = False
+) -> int:
+    """
+    Stores an email in the outbox. Run it inside the same transaction as the
+    user change so the email exists if and only if that change is committed.
+    """
+    query = insert(outbox_table).values(
+        **outbox_row(emails, subject, confirm_url, reset_password)
+    )
+    return await get_database().execute(query)
+
+
+async def enqueue_email_for_user(
+    emails: str, subject: str, confirm_url: str, reset_password: bool = False
+) -> Optional[int]:
+    """
+    Stores an email in the outbox only if a user with that address exists,
+    in a single INSERT ... SELECT. Returns the outbox id, or None.
+    """
+    row = outbox_row(emails, subject, confirm_url, reset_password)
+    users_table = User.__table__
+    rows = select(
+        *(literal(value, outbox_table.c[name].type) for name, value in row.items())
+    ).where(users_table.c.email == emails)
+    query = (
+        insert(outbox_table).from_select(list(row), rows).returning(outbox_table.c.id)
+    )
+    return await get_database().fetch_val(query)
+
+
+async def enqueue_emails(rows: List[dict]) -> None:
+    """Stores many `outbox_row` entries with a single multi-row insert."""
+    if rows:
+        await get_database().execute(insert(outbox_table).values(rows))
+
+
+class OutboxWorker:
+    """
+    Background task draining the email outbox in batches through the pooled
+    SMTP connections. Failed messages are retried with exponential backoff and
+    marked dead once `max_attempts` is reached. Claimed rows are leased, so a
+    row left in `sending` by a crashed worker is picked up again after the
+    lease expires.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        poll_interval: float,
+        max_attempts: int,
+        backoff_seconds: float,
+        backoff_max_seconds: float,
+        lease_seconds: float,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.lease_seconds = lease_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self) -> None:
+        """Wakes the worker up so freshly committed emails go out right away."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                drained = await self.drain_once()
+            except Exception:
+                logger.exception("Email outbox delivery failed")
+                drained = 0
+            # A full batch means there is probably more waiting
+            if drained >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> List:
+        now = datetime.now(timezone.utc)
+        due = (
+            (outbox_table.c.status == PENDING) | (outbox_table.c.status == SENDING)
+        ) & (outbox_table.c.next_attempt_at <= now)
+        batch = (
+            select(outbox_table.c.id)
+            .where(due)
+            .order_by(outbox_table.c.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        query = (
+            update(outbox_table)
+            .where(outbox_table.c.id.in_(batch), due)
+            .values(
+                status=SENDING,
+                next_attempt_at=now + timedelta(seconds=self.lease_seconds),
+            )
+            .returning(*outbox_table.c)
+        )
+        return await get_database().fetch_all(query)
+
+    def _backoff(self, attempts: int) -> timedelta:
+        delay = min(
+            self.backoff_max_seconds, self.backoff_seconds * 2 ** (attempts - 1)
+        )
+        return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+    async def drain_once(self) -> int:
+        """Delivers one batch of due emails and returns how many were claimed."""
+        rows = await self._claim()
+        if not rows:
+            return 0
+
+        messages = [
+            build_message(
+                row["recipient"],
+                row["subject"],
+                row["confirm_url"],
+                bool(row["reset_password"]),
+            )
+            for row in rows
+        ]
+        results = await send_many(messages)
+
+        database = get_database()
+        now = datetime.now(timezone.utc)
+        sent_ids = [row["id"] for row, error in zip(rows, results) if error is None]
+        if sent_ids:
+            await database.execute(
+                update(outbox_table)
+                .where(outbox_table.c.id.in_(sent_ids))
+                .values(status=SENT, sent_at=now, last_error=None)
+            )
+
+        for row, error in zip(rows, results):
+            if error is None:
+                continue
+            attempts = row["attempts"] + 1
+            dead = attempts >= self.max_attempts
+            await database.execute(
+                update(outbox_table)
+                .where(outbox_table.c.id == row["id"])
+                .values(
+                    status=DEAD if dead else PENDING,
+                    attempts=attempts,
+                    next_attempt_at=now + self._backoff(attempts),
+                    last_error=str(error)[:255],
+                )
+            )
+            if dead:
+                logger.error(
+                    "Email %s to %s moved to dead letter after %s attempts: %s",
+                    row["id"],
+                    row["recipient"],
+                    attempts,
+                    error,
+                )
+
+        return len(rows)
+
+
+outbox_worker = OutboxWorker(
+    batch_size=mail_config.OUTBOX_BATCH_SIZE,
+    poll_interval=mail_config.OUTBOX_POLL_INTERVAL,
+    max_attempts=mail_config.OUTBOX_MAX_ATTEMPTS,
+    backoff_seconds=mail_config.OUTBOX_BACKOFF_SECONDS,
+    backoff_max_seconds=mail_config.OUTBOX_BACKOFF_MAX_SECONDS,
+    lease_seconds=mail_config.OUTBOX_LEASE_SECONDS,
+)
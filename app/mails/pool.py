@@ -0,0 +1,129 @@
+import asyncio
+import time
+from collections import deque
+from email.message import EmailMessage
+from functools import lru_cache
+from types import ModuleType
+from typing import TYPE_CHECKING, Deque, Optional, Tuple
+from app.utils.metrics import smtp_sends
+
+if TYPE_CHECKING:
+    import aiosmtplib
+
+
+@lru_cache(maxsize=None)
+def smtp_client() -> ModuleType:
+    """aiosmtplib, imported with the first connection rather than at startup."""
+    import aiosmtplib
+
+    return aiosmtplib
+
+
+def connection_errors() -> Tuple[type, ...]:
+    # Errors after which the connection can no longer be trusted
+    return (smtp_client().SMTPServerDisconnected, ConnectionError, OSError)
+
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` authenticated SMTP connections open between sends.
+    Connections idle for longer than `idle_seconds` are checked with a NOOP
+    before reuse, and a send that hits a dropped connection reconnects once.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        use_tls: bool,
+        start_tls: bool,
+        validate_certs: bool,
+        use_credentials: bool,
+        size: int = 4,
+        idle_seconds: float = 60.0,
+        timeout: float = 60.0,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.validate_certs = validate_certs
+        self.use_credentials = use_credentials
+        self.size = max(1, size)
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self._idle: Deque[Tuple["aiosmtplib.SMTP", float]] = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        return self._slots
+
+    async def _connect(self) -> "aiosmtplib.SMTP":
+        smtp = smtp_client().SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            validate_certs=self.validate_certs,
+            timeout=self.timeout,
+        )
+        await smtp.connect()
+        if self.use_credentials:
+            await smtp.login(self.username, self.password)
+        return smtp
+
+    async def _checkout(self) -> "aiosmtplib.SMTP":
+        while self._idle:
+            smtp, last_used = self._idle.pop()
+            if not smtp.is_connected:
+                continue
+            if time.monotonic() - last_used > self.idle_seconds:
+                try:
+                    await smtp.noop()
+                except (smtp_client().SMTPException, *connection_errors()):
+                    smtp.close()
+                    continue
+            return smtp
+        return await self._connect()
+
+    def _checkin(self, smtp: "aiosmtplib.SMTP") -> None:
+        if smtp.is_connected:
+            self._idle.append((smtp, time.monotonic()))
+
+    async def send(self, message: EmailMessage) -> None:
+        started = time.perf_counter()
+        result = "error"
+        try:
+            await self._send(message)
+            result = "sent"
+        finally:
+            smtp_sends.observe(time.perf_counter() - started, result)
+
+    async def _send(self, message: EmailMessage) -> None:
+        async with self._get_slots():
+            smtp = await self._checkout()
+            try:
+                try:
+                    await smtp.send_message(message)
+                except connection_errors():
+                    # Server dropped a pooled connection, retry on a fresh one
+                    smtp.close()
+                    smtp = await self._connect()
+                    await smtp.send_message(message)
+            finally:
+                self._checkin(smtp)
+
+    async def close(self) -> None:
+        while self._idle:
+            smtp, _ = self._idle.pop()
+            try:
+                await smtp.quit()
+            except (smtp_client().SMTPException, *connection_errors()):
+                smtp.close()
+        self._slots = None
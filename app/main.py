@@ -1,9 +1,26 @@
+import time
+
+# Taken before the imports below, reported as the import time of the app
+import_started = time.perf_counter()
+
 from fastapi import FastAPI
+from app.api import metrics, watchdog
 from app.api.v1.routes import users
-from app.db.database import get_database, sqlalchemy_engine
-from app.models.models import Base
+from app.db.database import get_database, get_sync_engine, replica_set
+from app.db.migrate import check_schema_version, migrate
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from app.settings import origins
+from app.settings import settings
+from app.utils.passwords import password_hasher
+from app.mails.outbox import outbox_worker
+from app.mails.mail_config import start_mail, stop_mail
+from app.mails.pool import smtp_client
+from app.utils.metrics import MetricsMiddleware, loop_lag_monitor
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.refresh_tokens import refresh_token_pruner
+from app.utils.revocations import revocation_table
+from app.utils.startup import startup_report
+from app.utils.watchdog import loop_watchdog
 
 app = FastAPI(
     title="Procuremet App API",
@@ -13,22 +30,81 @@ app = FastAPI(
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins.split(","),
+    allow_origins=settings.ORIGINS.split(","),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After", "ETag", "X-Profile"],
 )
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+
+async def warm_up():
+    """
+    Pays upfront for what is otherwise built on first use: spawns the
+    hashing workers with bcrypt loaded and imports the SMTP client.
+    """
+    await password_hasher.warm_up()
+    smtp_client()
 
 
 @app.on_event("startup")
 async def startup():
-    await get_database().connect()
-    Base.metadata.create_all(sqlalchemy_engine)
+    with startup_report.step("database"):
+        await get_database().connect()
+        await replica_set.connect()
+    with startup_report.step("password_hasher"):
+        password_hasher.start()
+    if settings.DATABASE_AUTO_MIGRATE:
+        with startup_report.step("migrate"):
+            await run_in_threadpool(migrate, get_sync_engine())
+    with startup_report.step("schema_version"):
+        await check_schema_version(get_database())
+    # Cached principals are checked against the revocations as well
+    if settings.TOKEN_STATELESS or settings.PRINCIPAL_CACHE_SIZE > 0:
+        with startup_report.step("revocations"):
+            await revocation_table.refresh()
+            revocation_table.start()
+    refresh_token_pruner.start()
+    with startup_report.step("mail"):
+        await start_mail()
+        outbox_worker.start()
+    if settings.METRICS_ENABLED:
+        loop_lag_monitor.start()
+    if settings.WATCHDOG_ENABLED:
+        with startup_report.step("watchdog"):
+            loop_watchdog.start(
+                threshold=settings.WATCHDOG_THRESHOLD_MS / 1000,
+                interval=settings.WATCHDOG_INTERVAL_MS / 1000,
+                max_sites=settings.WATCHDOG_MAX_SITES,
+                stack_depth=settings.WATCHDOG_STACK_DEPTH,
+            )
+    if settings.STARTUP_WARM_UP:
+        with startup_report.step("warm_up"):
+            await warm_up()
+    startup_report.log()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await loop_lag_monitor.stop()
+    loop_watchdog.stop()
+    await revocation_table.stop()
+    await refresh_token_pruner.stop()
+    await outbox_worker.stop()
+    await stop_mail()
+    await replica_set.disconnect()
     await get_database().disconnect()
+    password_hasher.shutdown()
 
 
 app.include_router(users.router, prefix="/api/v1", tags=["Users"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
+if settings.WATCHDOG_ENABLED and settings.WATCHDOG_REPORT_ENABLED:
+    app.include_router(watchdog.router)
+
+startup_report.record("import", "app.main", time.perf_counter() - import_started)
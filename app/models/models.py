@@ -1,11 +1,12 @@
 from datetime import datetime, timezone
 from fastapi import HTTPException, status
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Index, text
+from sqlalchemy import LargeBinary
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.ext.declarative import declarative_base
-from passlib.context import CryptContext
+from app.utils.passwords import get_pwd_context, hash_password
+from app.utils.passwords import verify_password as verify_password_hash
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # Decaltative base to metadata
 Base = declarative_base()
 
@@ -14,12 +15,17 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String(30))
-    last_name = Column(String(30))
-    email = Column(String(50))
+    name = Column(String(30), index=True)
+    last_name = Column(String(30), index=True)
+    email = Column(String(50), unique=True, index=True)
     password_hash = Column(String(50))
     email_confirm = Column(String(50), default=False)
-    creation_date = Column(DateTime, default=datetime.now(timezone.utc))
+    creation_date = Column(DateTime, default=datetime.now(timezone.utc), index=True)
+    # Bumped whenever the user's outstanding tokens must stop working
+    token_version = Column(Integer, nullable=False, server_default=text("0"))
+    # Bumped by every write, ETag and Last-Modified of the user resources
+    row_version = Column(Integer, nullable=False, server_default=text("1"))
+    updated_at = Column(DateTime)
 
     def __repr__(self) -> str:
         return f"User(id={self.id!r}, email={self.email!r})"
@@ -30,11 +36,11 @@ class User(Base):
 
     @password.setter
     def password(self, password: str):
-        hahsed_password = pwd_context.hash(password)
+        hahsed_password = get_pwd_context().hash(password)
         self.password_hash = hahsed_password
 
     def verify_password(self, password: str) -> bool:
-        is_valid = pwd_context.verify(password, self.password_hash)
+        is_valid = get_pwd_context().verify(password, self.password_hash)
         if is_valid:
             return is_valid
         else:
@@ -42,3 +48,67 @@ class User(Base):
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid user credentials!",
             )
+
+    async def set_password_async(self, password: str):
+        self.password_hash = await hash_password(password)
+
+    async def verify_password_async(self, password: str) -> bool:
+        is_valid = await verify_password_hash(password, self.password_hash)
+        if is_valid:
+            return is_valid
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid user credentials!",
+            )
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String(50), nullable=False)
+    subject = Column(String(100), nullable=False)
+    confirm_url = Column(String(500), nullable=False)
+    reset_password = Column(Boolean, default=False)
+    # pending -> sending -> sent, or dead once retries are exhausted
+    status = Column(String(10), default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String(255))
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime)
+
+    def __repr__(self) -> str:
+        return f"EmailOutbox(id={self.id!r}, status={self.status!r})"
+
+
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+
+    user_id = Column(Integer, primary_key=True)
+    # Tokens with a lower version issued before revoked_at are rejected
+    token_version = Column(Integer, nullable=False)
+    revoked_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"TokenRevocation(user_id={self.user_id!r}, version={self.token_version!r})"
+        )
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    # Keyed hash of the token, the token itself is never stored
+    token_hash = Column(LargeBinary(32), primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    # users.token_version when issued, the token dies with a password change
+    token_version = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"RefreshToken(user_id={self.user_id!r}, expires_at={self.expires_at!r})"
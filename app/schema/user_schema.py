@@ -1,5 +1,7 @@
-from typing import Optional
-from pydantic import BaseModel, EmailStr, ValidationError, validator
+from enum import Enum
+from typing import List, Optional
+from pydantic import BaseModel, EmailStr, ValidationError, conlist, validator
+from app.settings import settings
 import re
 
 
@@ -136,3 +138,72 @@ class UserCredentials(BaseModel):
 class AccessToken(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+
+class UserSortKey(str, Enum):
+    id = "id"
+    name = "name"
+    last_name = "last_name"
+    email = "email"
+    creation_date = "creation_date"
+
+
+class BatchUser(BaseModel):
+    id: int
+    found: bool
+    user: Optional[UserFromDB]
+
+
+class BatchOperationType(str, Enum):
+    update = "update"
+    delete = "delete"
+
+
+class BatchOperation(BaseModel):
+    op: BatchOperationType
+    id: int
+    data: Optional[UserUpdate]
+
+    @validator("data", always=True)
+    @classmethod
+    def data_for_updates(cls, data: Optional[UserUpdate], values: dict):
+        if values.get("op") == BatchOperationType.update and data is None:
+            raise ValueError("update operations require data")
+        return data
+
+
+class UserBatch(BaseModel):
+    operations: conlist(
+        BatchOperation, min_items=1, max_items=settings.BATCH_MAX_USERS
+    )  # type: ignore
+
+    @validator("operations")
+    @classmethod
+    def one_operation_per_user(cls, operations: List[BatchOperation]):
+        seen = set()
+        for operation in operations:
+            if operation.id in seen:
+                raise ValueError(f"user {operation.id} appears in several operations")
+            seen.add(operation.id)
+        return operations
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "operations": [
+                    {"op": "update", "id": 123, "data": {"name": "John"}},
+                    {"op": "delete", "id": 124},
+                ]
+            }
+        }
+
+
+class BatchOperationResult(BaseModel):
+    op: BatchOperationType
+    id: int
+    user: Optional[UserFromDB]
@@ -11,11 +11,160 @@ class AppSettings:
     # Env variables
     # -- Secret Key
     SECRET_KEY = config.get("secret", "SECRET_KEY") or "hard to guess string"
+
     # -- Database
     DATABASE_URI = config.get("db", "DATABASE_URI")
+    # Apply pending migrations at startup instead of only checking the version
+    DATABASE_AUTO_MIGRATE = config.getboolean(
+        "db", "DATABASE_AUTO_MIGRATE", fallback=False
+    )
+
+    # -- Startup: build lazily created objects (hashing workers, SMTP client)
+    # before serving instead of on first use
+    STARTUP_WARM_UP = config.getboolean("startup", "STARTUP_WARM_UP", fallback=False)
+
+    # -- Metrics
+    METRICS_ENABLED = config.getboolean("metrics", "METRICS_ENABLED", fallback=True)
+    METRICS_LOOP_LAG_INTERVAL = config.getfloat(
+        "metrics", "METRICS_LOOP_LAG_INTERVAL", fallback=0.5
+    )
+    # -- Event loop watchdog: logs and counts code blocking the loop for
+    # longer than the threshold, aggregated by call site
+    WATCHDOG_ENABLED = config.getboolean("watchdog", "WATCHDOG_ENABLED", fallback=False)
+    # Also serve the report, with stacks and file paths, at /debug/event-loop;
+    # meant for debugging deployments only, any authenticated user can read it
+    WATCHDOG_REPORT_ENABLED = config.getboolean(
+        "watchdog", "WATCHDOG_REPORT_ENABLED", fallback=False
+    )
+    WATCHDOG_THRESHOLD_MS = config.getfloat(
+        "watchdog", "WATCHDOG_THRESHOLD_MS", fallback=100.0
+    )
+    WATCHDOG_INTERVAL_MS = config.getfloat(
+        "watchdog", "WATCHDOG_INTERVAL_MS", fallback=20.0
+    )
+    WATCHDOG_MAX_SITES = config.getint("watchdog", "WATCHDOG_MAX_SITES", fallback=200)
+    WATCHDOG_STACK_DEPTH = config.getint(
+        "watchdog", "WATCHDOG_STACK_DEPTH", fallback=30
+    )
+    # -- Profiling: a request carrying a signed X-Profile-Token header runs
+    # under cProfile, its stats are written to PROFILING_DIR (empty for a
+    # directory under the system temp dir), which keeps the newest
+    # PROFILING_MAX_FILES of them
+    PROFILING_ENABLED = config.getboolean(
+        "profiling", "PROFILING_ENABLED", fallback=False
+    )
+    PROFILING_DIR = config.get("profiling", "PROFILING_DIR", fallback="")
+    PROFILING_MAX_FILES = config.getint("profiling", "PROFILING_MAX_FILES", fallback=50)
+    PROFILING_TOKEN_MAX_AGE = config.getint(
+        "profiling", "PROFILING_TOKEN_MAX_AGE", fallback=900
+    )
+    PROFILING_TOP_FUNCTIONS = config.getint(
+        "profiling", "PROFILING_TOP_FUNCTIONS", fallback=5
+    )
+
+    # -- CORS, comma separated allowed origins
+    ORIGINS = config.get("origins", "ORIGINS")
 
     ACCESS_TOKEN_EXPIRE_MINUTES = 60
     ALGORITHM = "HS256"
+    # Issue tokens carrying the public profile and authenticate them without
+    # a database lookup, revocations are checked against an in-memory table
+    TOKEN_STATELESS = config.getboolean("security", "TOKEN_STATELESS", fallback=False)
+    TOKEN_REVOCATION_REFRESH_SECONDS = config.getfloat(
+        "security", "TOKEN_REVOCATION_REFRESH_SECONDS", fallback=5.0
+    )
+    # Single use refresh tokens renewing access tokens without a password,
+    # each rotation keeps the expiry of the login that started the session
+    REFRESH_TOKEN_EXPIRE_DAYS = config.getfloat(
+        "security", "REFRESH_TOKEN_EXPIRE_DAYS", fallback=30.0
+    )
+    REFRESH_TOKEN_PRUNE_SECONDS = config.getfloat(
+        "security", "REFRESH_TOKEN_PRUNE_SECONDS", fallback=3600.0
+    )
+
+    # -- Authenticated principal cache
+    # Entries are dropped at once by the worker changing the user. Other
+    # workers see a revoked token once their revocation table refreshes,
+    # and a profile or email change only when the entry expires, so keep
+    # the TTL short
+    PRINCIPAL_CACHE_SIZE = config.getint(
+        "security", "PRINCIPAL_CACHE_SIZE", fallback=10000
+    )
+    PRINCIPAL_CACHE_TTL_SECONDS = config.getfloat(
+        "security", "PRINCIPAL_CACHE_TTL_SECONDS", fallback=10.0
+    )
+
+    # Comma separated read replica URLs, reads may go there while writes, and
+    # reads following a write in the same request, stay on DATABASE_URI
+    DATABASE_REPLICA_URIS = config.get("db", "DATABASE_REPLICA_URIS", fallback="")
+    # round_robin or least_connections
+    DATABASE_REPLICA_STRATEGY = config.get(
+        "db", "DATABASE_REPLICA_STRATEGY", fallback="round_robin"
+    )
+    # -- SQLite profile, applied to every new connection; empty skips a pragma
+    SQLITE_JOURNAL_MODE = config.get("db", "SQLITE_JOURNAL_MODE", fallback="WAL")
+    SQLITE_SYNCHRONOUS = config.get("db", "SQLITE_SYNCHRONOUS", fallback="NORMAL")
+    SQLITE_MMAP_SIZE = config.get("db", "SQLITE_MMAP_SIZE", fallback="268435456")
+    SQLITE_CACHE_SIZE = config.get("db", "SQLITE_CACHE_SIZE", fallback="-65536")
+    SQLITE_BUSY_TIMEOUT_MS = config.get("db", "SQLITE_BUSY_TIMEOUT_MS", fallback="5000")
+    SQLITE_TEMP_STORE = config.get("db", "SQLITE_TEMP_STORE", fallback="MEMORY")
+    # -- Connections kept open per worker process, plus overflow under load
+    DATABASE_POOL_SIZE = config.getint("db", "DATABASE_POOL_SIZE", fallback=8)
+    DATABASE_MAX_OVERFLOW = config.getint("db", "DATABASE_MAX_OVERFLOW", fallback=16)
+    DATABASE_POOL_TIMEOUT = config.getfloat(
+        "db", "DATABASE_POOL_TIMEOUT", fallback=30.0
+    )
+
+    # -- User search: how many matches are ranked for each query
+    SEARCH_CANDIDATES = config.getint("db", "SEARCH_CANDIDATES", fallback=200)
+
+    # -- Batch read and update endpoints: users per request
+    BATCH_MAX_USERS = config.getint("db", "BATCH_MAX_USERS", fallback=100)
+
+    # -- Bulk user import
+    IMPORT_BATCH_SIZE = config.getint("db", "IMPORT_BATCH_SIZE", fallback=500)
+    IMPORT_MAX_LINE_BYTES = config.getint("db", "IMPORT_MAX_LINE_BYTES", fallback=65536)
+
+    # -- Password hashing pool, per worker process: with several uvicorn
+    # workers the bcrypt processes add up, keep workers x this <= CPUs
+    PASSWORD_HASH_WORKERS = config.getint(
+        "security", "PASSWORD_HASH_WORKERS", fallback=2
+    )
+    PASSWORD_HASH_QUEUE_LIMIT = config.getint(
+        "security", "PASSWORD_HASH_QUEUE_LIMIT", fallback=64
+    )
+    PASSWORD_HASH_USE_PROCESSES = config.getboolean(
+        "security", "PASSWORD_HASH_USE_PROCESSES", fallback=True
+    )
+
+    # -- Admission control for bcrypt and email heavy routes
+    ADMISSION_LOGIN_CONCURRENCY = config.getint(
+        "admission", "ADMISSION_LOGIN_CONCURRENCY", fallback=8
+    )
+    ADMISSION_LOGIN_QUEUE = config.getint(
+        "admission", "ADMISSION_LOGIN_QUEUE", fallback=32
+    )
+    ADMISSION_ACCOUNT_CONCURRENCY = config.getint(
+        "admission", "ADMISSION_ACCOUNT_CONCURRENCY", fallback=4
+    )
+    ADMISSION_ACCOUNT_QUEUE = config.getint(
+        "admission", "ADMISSION_ACCOUNT_QUEUE", fallback=16
+    )
+    ADMISSION_QUEUE_TIMEOUT = config.getfloat(
+        "admission", "ADMISSION_QUEUE_TIMEOUT", fallback=2.0
+    )
+    # -- Login attempt limits, a non positive rate disables the limit
+    LOGIN_IP_PER_MINUTE = config.getfloat(
+        "admission", "LOGIN_IP_PER_MINUTE", fallback=60.0
+    )
+    LOGIN_IP_BURST = config.getint("admission", "LOGIN_IP_BURST", fallback=30)
+    LOGIN_EMAIL_PER_MINUTE = config.getfloat(
+        "admission", "LOGIN_EMAIL_PER_MINUTE", fallback=5.0
+    )
+    LOGIN_EMAIL_BURST = config.getint("admission", "LOGIN_EMAIL_BURST", fallback=10)
+    LOGIN_LIMITER_SIZE = config.getint(
+        "admission", "LOGIN_LIMITER_SIZE", fallback=100000
+    )
 
 
 class MailConfig:
@@ -30,8 +179,29 @@ class MailConfig:
     MAIL_PASSWORD = config.get("email", "MAIL_PASSWORD")
     MAIL_SUBJECT_PREFIX = "[Procurement App]"
     MAIL_FROM = "Procurement Admin <procurement@example.com>"
+    MAIL_TIMEOUT = config.getfloat("email", "MAIL_TIMEOUT", fallback=60.0)
+    # -- SMTP connection pool
+    MAIL_POOL_SIZE = config.getint("email", "MAIL_POOL_SIZE", fallback=4)
+    MAIL_POOL_IDLE_SECONDS = config.getfloat(
+        "email", "MAIL_POOL_IDLE_SECONDS", fallback=60.0
+    )
+    # -- Outbox delivery worker
+    OUTBOX_BATCH_SIZE = config.getint("email", "OUTBOX_BATCH_SIZE", fallback=50)
+    OUTBOX_POLL_INTERVAL = config.getfloat(
+        "email", "OUTBOX_POLL_INTERVAL", fallback=5.0
+    )
+    OUTBOX_MAX_ATTEMPTS = config.getint("email", "OUTBOX_MAX_ATTEMPTS", fallback=8)
+    OUTBOX_BACKOFF_SECONDS = config.getfloat(
+        "email", "OUTBOX_BACKOFF_SECONDS", fallback=30.0
+    )
+    OUTBOX_BACKOFF_MAX_SECONDS = config.getfloat(
+        "email", "OUTBOX_BACKOFF_MAX_SECONDS", fallback=3600.0
+    )
+    OUTBOX_LEASE_SECONDS = config.getfloat(
+        "email", "OUTBOX_LEASE_SECONDS", fallback=300.0
+    )
 
 
-origins = config.get("origins", "ORIGINS")
-mail_config = MailConfig()
 settings = AppSettings()
+mail_config = MailConfig()
+origins = settings.ORIGINS
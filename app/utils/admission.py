@@ -0,0 +1,185 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Tuple
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+from app.settings import settings
+from app.utils.metrics import Counter, Gauge, registry
+
+
+class AdmissionGate:
+    """
+    Caps how many requests of a route group run at once. Up to `queue_limit`
+    more wait in FIFO order for at most `queue_timeout` seconds; anything
+    beyond that is shed with a 503 and a Retry-After header, so a burst on
+    expensive routes cannot starve the rest of the API.
+
+    Instances are FastAPI dependencies holding a slot for the whole request.
+    """
+
+    def __init__(self, name: str, limit: int, queue_limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_limit = max(0, queue_limit)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(not waiter.done() for waiter in self._waiters)
+
+    def _overloaded(self, reason: str) -> HTTPException:
+        rejected_requests.inc(self.name, reason)
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again later",
+            headers={"Retry-After": str(max(1, math.ceil(self.queue_timeout)))},
+        )
+
+    async def acquire(self) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if self.queued >= self.queue_limit:
+            raise self._overloaded("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up, pass it on
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(error, asyncio.TimeoutError):
+                raise self._overloaded("queue_timeout")
+            raise
+
+    def release(self) -> None:
+        # Hand the slot straight to the oldest waiter so it cannot be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def __call__(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by an arbitrary string (client IP, email...). Each key
+    may spend `burst` requests at once and regains `per_minute` per minute.
+    Only the `maxsize` most recently seen keys are tracked. A non positive
+    `per_minute` disables the limiter.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int, maxsize: int):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def hit(self, key: str) -> float:
+        """Spends one token for `key`, returns 0 or the seconds to wait."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+rejected_requests = registry.register(
+    Counter(
+        "admission_rejected_total",
+        "Requests shed by admission control",
+        ("group", "reason"),
+    )
+)
+
+login_gate = AdmissionGate(
+    "login",
+    limit=settings.ADMISSION_LOGIN_CONCURRENCY,
+    queue_limit=settings.ADMISSION_LOGIN_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+)
+account_gate = AdmissionGate(
+    "account",
+    limit=settings.ADMISSION_ACCOUNT_CONCURRENCY,
+    queue_limit=settings.ADMISSION_ACCOUNT_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+)
+gates = (login_gate, account_gate)
+
+login_ip_limiter = RateLimiter(
+    "ip",
+    per_minute=settings.LOGIN_IP_PER_MINUTE,
+    burst=settings.LOGIN_IP_BURST,
+    maxsize=settings.LOGIN_LIMITER_SIZE,
+)
+login_email_limiter = RateLimiter(
+    "email",
+    per_minute=settings.LOGIN_EMAIL_PER_MINUTE,
+    burst=settings.LOGIN_EMAIL_BURST,
+    maxsize=settings.LOGIN_LIMITER_SIZE,
+)
+
+registry.register(
+    Gauge(
+        "admission_active",
+        "Requests holding an admission slot",
+        ("group",),
+        callback=lambda: [((gate.name,), gate.active) for gate in gates],
+    )
+)
+registry.register(
+    Gauge(
+        "admission_queued",
+        "Requests waiting for an admission slot",
+        ("group",),
+        callback=lambda: [((gate.name,), gate.queued) for gate in gates],
+    )
+)
+
+
+async def limit_login_attempts(
+    request: Request, form_data: OAuth2PasswordRequestForm = Depends()
+):
+    """Rejects login attempts over the per client IP or per email budget."""
+    client_ip = request.client.host if request.client else "unknown"
+    for limiter, key in (
+        (login_ip_limiter, client_ip),
+        (login_email_limiter, form_data.username.strip().lower()),
+    ):
+        retry_after = limiter.hit(key)
+        if retry_after:
+            rejected_requests.inc("login", limiter.name)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of authenticated principals keyed by access token.
+    Each entry holds the decoded claims and the resolved user, and expires
+    after `ttl` seconds or at the token's `exp`, whichever comes first.
+    Entries are indexed by user id so writes can drop them explicitly.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, dict, Any]]" = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[Tuple[dict, Any]]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, claims, user = entry
+        if expires_at <= time.time():
+            self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return claims, user
+
+    def set(self, token: str, claims: dict, user: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if claims.get("exp") is not None:
+            expires_at = min(expires_at, float(claims["exp"]))
+        self._remove(token)
+        self._entries[token] = (expires_at, claims, user)
+        self._by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        for token in self._by_user.pop(user_id, ()):
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[2].id
+        tokens = self._by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user_id]
@@ -0,0 +1,114 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterable, Mapping, NamedTuple, Optional, Union
+from fastapi import HTTPException, Request, status
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored naive in UTC; HTTP dates have second precision."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def creation_stamp(created: Union[datetime, str, None]) -> str:
+    """
+    Creation time of a row in microseconds, as hex. SQLite reuses the ids of
+    deleted rows, so the id and row_version alone can name two different
+    users; their creation times tell them apart.
+    """
+    if created is None:
+        return "0"
+    if isinstance(created, str):
+        created = datetime.fromisoformat(created)
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return format(round(created.timestamp() * 1_000_000), "x")
+
+
+class Validators(NamedTuple):
+    """
+    ETag and Last-Modified of a representation. The ETag is strong: the same
+    row versions always serialize to the same bytes. `dated` tells whether
+    Last-Modified may validate it too, which is not the case for pages,
+    since rows leaving a page change it without updating any timestamp.
+    """
+
+    etag: str
+    last_modified: Optional[datetime] = None
+    dated: bool = True
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def matches(self, request: Request) -> bool:
+        """Whether the client's copy, per RFC 7232 section 6, is still current."""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Weak comparison, the one defined for If-None-Match
+            tags = {
+                tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")
+            }
+            return "*" in tags or self.etag in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if not if_modified_since or not self.dated or self.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return self.last_modified <= since
+
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def user_validators(
+    user_id: int,
+    row_version: Optional[int],
+    updated_at: Optional[datetime] = None,
+    created: Union[datetime, str, None] = None,
+) -> Optional[Validators]:
+    """Validators of one user, None when its row_version is unknown."""
+    if row_version is None:
+        return None
+    return Validators(
+        etag=f'"u{user_id}.{row_version}.{creation_stamp(created)}"',
+        last_modified=as_utc(updated_at),
+    )
+
+
+def page_validators(rows: Iterable[Mapping]) -> Validators:
+    """Validators of a page of users, from the ids and versions of its rows."""
+    digest = hashlib.blake2b(digest_size=12)
+    last_modified = None
+    for row in rows:
+        stamp = creation_stamp(row["creation_date"])
+        digest.update(f'{row["id"]}.{row["row_version"]}.{stamp},'.encode())
+        updated_at = as_utc(row["updated_at"])
+        if updated_at is not None and (
+            last_modified is None or updated_at > last_modified
+        ):
+            last_modified = updated_at
+    return Validators(
+        etag=f'"p{digest.hexdigest()}"', last_modified=last_modified, dated=False
+    )
+
+
+def check_not_modified(request: Request, validators: Optional[Validators]) -> None:
+    """Answers 304 Not Modified, without a body, when the client is current."""
+    if validators is not None and validators.matches(request):
+        raise HTTPException(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=validators.headers()
+        )
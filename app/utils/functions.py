@@ -1,17 +1,27 @@
 from datetime import datetime, timedelta, timezone
-from typing import List, Tuple, cast
-from fastapi import Depends, HTTPException, Query, status
+from typing import Any, List, Mapping, Optional, Tuple, cast
+from fastapi import Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
 from app.models.models import User
-from app.db.database import get_db
-from app.schema.user_schema import UserFromDB, AccessToken
+from app.db.repositories import UserRepository, get_user_repository, public_record
+from app.db.repositories import get_read_user_repository, to_bool
+from app.schema.user_schema import UserFromDB, AccessToken, UserSortKey
 from app.settings import settings
+from app.utils.cache import PrincipalCache
+from app.utils.conditional import check_not_modified, is_conditional
+from app.utils.conditional import page_validators
+from app.utils.revocations import revocation_table
+import base64
+import json
 import secrets
 import jwt
 
 # OAuth instance
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/users/token")
+# Resolved users by token, invalidated by the routes that change a user
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
 
 
 async def pagination(
@@ -22,44 +32,107 @@ async def pagination(
     return (skip, capped_limit)
 
 
+async def batch_ids(
+    ids: List[str] = Query(..., description="User ids, comma separated or repeated"),
+) -> List[int]:
+    try:
+        user_ids = [int(part) for value in ids for part in value.split(",") if part]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid user ids"
+        )
+    if not user_ids or len(user_ids) > settings.BATCH_MAX_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Between 1 and {settings.BATCH_MAX_USERS} user ids are allowed",
+        )
+    return user_ids
+
+
+def encode_cursor(sort: str, row: Mapping) -> str:
+    value = row[sort]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        # Only values the sort column can hold may reach the query, bool is an int
+        value_type = int if sort == UserSortKey.id else str
+        if (
+            cursor_sort != sort
+            or not isinstance(last_id, int)
+            or isinstance(last_id, bool)
+            or not (value is None or isinstance(value, value_type))
+            or isinstance(value, bool)
+        ):
+            raise ValueError(cursor)
+        if sort == UserSortKey.creation_date and value is not None:
+            value = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return value, last_id
+
+
 def generate_salt():
     """Generates a cryptographically secure random salt."""
     return secrets.token_urlsafe(32)
 
 
-def get_user_or_404(user_id: int, db: Session = Depends(get_db)) -> UserFromDB:
-    user: User = db.query(User).filter_by(id=user_id).one_or_none()
+async def get_user_or_404(
+    user_id: int, repository: UserRepository = Depends(get_read_user_repository)
+) -> Mapping:
+    """Public and version columns of the user."""
+    user = await repository.get_versioned_by_id(user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found!"
         )
 
-    user = cast(UserFromDB, user.__dict__)
-
     return user
 
 
-def get_all_users(
-    pagination: Tuple[int, int] = Depends(pagination), db: Session = Depends(get_db)
+async def get_all_users(
+    request: Request,
+    response: Response,
+    pagination: Tuple[int, int] = Depends(pagination),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of a page"),
+    sort: UserSortKey = Query(UserSortKey.id),
+    email_confirm: Optional[bool] = Query(None),
+    repository: UserRepository = Depends(get_read_user_repository),
 ) -> List[UserFromDB]:
     skip, limit = pagination
-    users = db.query(User).offset(skip).limit(limit).all()
+    after = decode_cursor(cursor, sort.value) if cursor else None
+    page = dict(
+        skip=skip,
+        limit=limit,
+        sort=sort.value,
+        after=after,
+        email_confirm=email_confirm,
+    )
+    # Revalidation only needs the ids and versions of the page
+    if is_conditional(request):
+        versions = await repository.list(**page, versions_only=True)
+        check_not_modified(request, page_validators(versions))
+    rows = await repository.list(**page)
+    response.headers.update(page_validators(rows).headers())
+    # A full page may have more rows after it
+    if limit and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(sort.value, rows[-1])
 
-    users_list = [
-        UserFromDB(
-            id=user.id,
-            name=user.name,
-            last_name=user.last_name,
-            email=user.email,
-            email_confirm=user.email_confirm,
-        )
-        for user in users
-    ]
+    # Rows come from the database, no need to validate them again
+    users_list = [cast(UserFromDB, public_record(row)) for row in rows]
     return users_list
 
 
-def get_user_by_email_or_404(email: str, db: Session) -> User:
-    user = db.query(User).filter_by(email=email).one_or_none()
+async def get_user_by_email_or_404(email: str, repository: UserRepository) -> User:
+    user = await repository.get_by_email(email)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="user email not found!"
@@ -67,12 +140,50 @@ def get_user_by_email_or_404(email: str, db: Session) -> User:
     return user
 
 
+def token_claims(user: User) -> dict:
+    """
+    Claims of an access token for `user`. In stateless mode they also carry
+    the public profile, which stays as issued until the token expires.
+    """
+    claims = {"sub": user.email, "ver": user.token_version or 0}
+    if settings.TOKEN_STATELESS:
+        claims.update(
+            id=user.id,
+            name=user.name,
+            last_name=user.last_name,
+            email_confirm=to_bool(user.email_confirm),
+            rv=user.row_version,
+            # The version validators of /users/me, see app.utils.conditional
+            cd=iso_or_none(user.creation_date),
+            ua=iso_or_none(user.updated_at),
+        )
+    return claims
+
+
+def iso_or_none(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def user_from_claims(claims: dict) -> User:
+    return User(
+        id=claims["id"],
+        name=claims["name"],
+        last_name=claims["last_name"],
+        email=claims["sub"],
+        email_confirm=claims["email_confirm"],
+        token_version=claims["ver"],
+        row_version=claims.get("rv"),
+        creation_date=claims.get("cd"),
+        updated_at=claims.get("ua"),
+    )
+
+
 def create_jwt_token(data: dict) -> AccessToken:
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(
-        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
-    )
-    to_encode.update({"exp": expire})
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    # Fractional issue time, compared with revocations made in the same second
+    to_encode.update({"exp": expire, "iat": now.timestamp()})
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
     )
@@ -100,14 +211,26 @@ def decode_jwt_token(token: str):
         )
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    repository: UserRepository = Depends(get_user_repository),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Also in stateless mode, for tokens issued without the profile claims
+    cached = principal_cache.get(token)
+    if cached is not None:
+        claims, user = cached
+        # Other workers' password changes and deletes reach this worker
+        # through the revocation table, not through the cache
+        if revocation_table.is_revoked(
+            user.id, claims.get("ver", 0), claims.get("iat", 0)
+        ):
+            raise credentials_exception
+        return user
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -116,10 +239,19 @@ def get_current_user(
 
         if user_email is None:
             raise credentials_exception
-        user = get_user_by_email_or_404(email=user_email, db=db)
+        # Tokens carrying the profile are trusted without a database lookup
+        if settings.TOKEN_STATELESS and "id" in payload:
+            if revocation_table.is_revoked(
+                payload["id"], payload.get("ver", 0), payload.get("iat", 0)
+            ):
+                raise credentials_exception
+            return user_from_claims(payload)
+
+        user = await get_user_by_email_or_404(email=user_email, repository=repository)
 
-        if user is None:
+        if user is None or payload.get("ver", 0) < (user.token_version or 0):
             raise credentials_exception
+        principal_cache.set(token, payload, user)
         return user
 
     except jwt.PyJWTError:
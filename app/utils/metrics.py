@@ -0,0 +1,410 @@
+import asyncio
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.settings import settings
+
+# Latency buckets in seconds, from sub-millisecond reads to slow bcrypt/SMTP
+default_buckets = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+# Count and seconds per component (db, bcrypt, smtp) of the request being
+# profiled; None, the default, outside of a profiled request
+profiled_components: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar(
+    "profiled_components", default=None
+)
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        # Evaluated only when scraped, for totals counted by other objects
+        self._callback = callback
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        if self._callback is not None:
+            values.extend(self._callback())
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        # Evaluated only when scraped, for values owned by other objects
+        self._callback = callback
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        if self._callback is not None:
+            values.extend(self._callback())
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = default_buckets,
+        component: Optional[str] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Observations are also added to the profiled request's component
+        self.component = component
+        # Per label set: [count per bucket + overflow], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+        if self.component is not None:
+            components = profiled_components.get()
+            if components is not None:
+                totals = components.setdefault(self.component, [0, 0.0])
+                totals[0] += 1
+                totals[1] += value
+
+    def time(self, *labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def counts(self) -> Dict[LabelValues, int]:
+        """Observations so far per label set."""
+        with self._lock:
+            return {labels: sum(counts) for labels, (counts, _) in self._values.items()}
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [
+                (labels, list(counts), total[0])
+                for labels, (counts, total) in self._values.items()
+            ]
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    self.label_names, labels, f'le="{_format_value(bound)}"'
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Timer:
+    """Context manager observing the elapsed wall time into a histogram."""
+
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template",
+        ("method", "route", "status"),
+    )
+)
+http_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "HTTP requests currently being served")
+)
+db_queries = registry.register(
+    Histogram(
+        "db_query_duration_seconds",
+        "Database statement latency by statement fingerprint",
+        ("statement",),
+        component="db",
+    )
+)
+password_hashing = registry.register(
+    Histogram(
+        "password_hash_duration_seconds",
+        "bcrypt hash/verify latency including time queued for the pool",
+        ("operation",),
+        component="bcrypt",
+    )
+)
+smtp_sends = registry.register(
+    Histogram(
+        "smtp_send_duration_seconds",
+        "SMTP send latency",
+        ("result",),
+        component="smtp",
+    )
+)
+event_loop_lag = registry.register(
+    Histogram(
+        "event_loop_lag_seconds",
+        "Delay between when a loop callback was due and when it ran",
+    )
+)
+
+# SQL verb and first table, e.g. "SELECT users"; literal values never appear
+statement_pattern = re.compile(
+    r"^\s*(?P<verb>SELECT|INSERT|UPDATE|DELETE|WITH|CREATE|DROP|ALTER|PRAGMA)\b"
+    r"(?:.*?\b(?:FROM|INTO|UPDATE|TABLE|INDEX)\s+(?:IF (?:NOT )?EXISTS\s+)?"
+    r"[\"`]?(?P<table>\w+))?",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint_sql(statement: str) -> str:
+    match = statement_pattern.match(statement)
+    if match is None:
+        return "OTHER"
+    verb = match.group("verb").upper()
+    table = match.group("table")
+    return f"{verb} {table}" if table else verb
+
+
+def fingerprint(query) -> str:
+    """Cheap, low-cardinality label for a SQLAlchemy statement or SQL string."""
+    if isinstance(query, str):
+        return fingerprint_sql(query)
+    verb = getattr(query, "__visit_name__", "other").upper()
+    table = getattr(query, "table", None)
+    if table is None:
+        froms = getattr(query, "get_final_froms", None)
+        froms = froms() if froms is not None else ()
+        table = froms[0] if froms else None
+    name = getattr(table, "name", None)
+    if verb == "TEXTCLAUSE":
+        return fingerprint_sql(query.text)
+    return f"{verb} {name}" if name else verb
+
+
+def instrument_engine(engine) -> None:
+    """Times every statement run through a synchronous SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info["query_started"].pop()
+        db_queries.observe(time.perf_counter() - started, fingerprint_sql(statement))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency per route template (not per raw path,
+    which would explode label cardinality) and the number of requests in flight.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    def _route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._routes.get(endpoint)
+        if path is None:
+            router = scope["app"].router
+            self._routes = {
+                route.endpoint: route.path
+                for route in router.routes
+                if hasattr(route, "endpoint")
+            }
+            path = self._routes.get(endpoint, "unmatched")
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            http_requests.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                self._route_path(scope),
+                str(status_code),
+            )
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. event loop blocking."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            event_loop_lag.observe(max(0.0, loop.time() - expected))
+
+
+loop_lag_monitor = LoopLagMonitor(settings.METRICS_LOOP_LAG_INTERVAL)
@@ -0,0 +1,162 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, List, Optional
+from fastapi import HTTPException, status
+from app.settings import settings
+from app.utils.metrics import password_hashing
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context() -> "CryptContext":
+    """
+    Built on first use: importing passlib and loading the bcrypt backend is
+    only paid by the processes that hash, mostly the hashing workers.
+    """
+    from passlib.context import CryptContext
+
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context.handler("bcrypt").get_backend()
+    return pwd_context
+
+
+def _hash(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+
+def _hash_many(passwords: List[str]) -> List[str]:
+    pwd_context = get_pwd_context()
+    return [pwd_context.hash(password) for password in passwords]
+
+
+def _verify(password: str, password_hash: str) -> bool:
+    return get_pwd_context().verify(password, password_hash)
+
+
+def _warm_up() -> None:
+    get_pwd_context()
+
+
+def worker_context() -> multiprocessing.context.BaseContext:
+    """
+    Workers are started from a clean server process, or spawned, never forked
+    from this one: by the time the pool starts, the database, watchdog and
+    executor threads may hold locks a forked child would inherit held.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Imported once by the server, every worker forked from it has them
+    context.set_forkserver_preload([__name__, "passlib.context"])
+    return context
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a worker pool so the event loop
+    keeps serving other requests. Jobs beyond `workers + queue_limit` are
+    rejected with a 503 instead of piling up behind the pool.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, use_processes: bool = True):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = self._create_executor()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def warm_up(self) -> None:
+        """Starts the workers and has each of them build its CryptContext."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        # Busy workers make the pool spawn the next one for the next job
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, _warm_up)
+                for _ in range(self.workers)
+            )
+        )
+
+    def _create_executor(self) -> Executor:
+        if self.use_processes:
+            try:
+                return ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=worker_context()
+                )
+            except (OSError, NotImplementedError):
+                # No process support (e.g. missing semaphores), use threads
+                pass
+        return self._thread_executor()
+
+    def _thread_executor(self) -> Executor:
+        return ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="password-hasher"
+        )
+
+    async def _run(self, func: Callable, *args):
+        if self._pending >= self.workers + self.queue_limit:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again later",
+                headers={"Retry-After": "1"},
+            )
+        self.start()
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            try:
+                return await loop.run_in_executor(self._executor, func, *args)
+            except (BrokenProcessPool, OSError):
+                # Worker processes could not be spawned, degrade to threads
+                self._executor.shutdown(wait=False)
+                self._executor = self._thread_executor()
+                return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        with password_hashing.time("hash"):
+            return await self._run(_hash, password)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hashes a batch as one job per worker so it spreads across the pool."""
+        if not passwords:
+            return []
+        size = -(-len(passwords) // self.workers)
+        chunks = [passwords[i : i + size] for i in range(0, len(passwords), size)]
+        with password_hashing.time("hash_many"):
+            hashed = await asyncio.gather(*(self._run(_hash_many, c) for c in chunks))
+        return [password_hash for chunk in hashed for password_hash in chunk]
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        with password_hashing.time("verify"):
+            return await self._run(_verify, password, password_hash)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+    use_processes=settings.PASSWORD_HASH_USE_PROCESSES,
+)
+
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    return await password_hasher.verify(password, password_hash)
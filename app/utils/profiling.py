@@ -0,0 +1,230 @@
+import argparse
+import cProfile
+import itertools
+import logging
+import os
+import pstats
+import re
+import tempfile
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from starlette.concurrency import run_in_threadpool
+from app.settings import settings
+from app.utils.metrics import profiled_components
+
+logger = logging.getLogger(__name__)
+
+token_header = b"x-profile-token"
+summary_header = b"x-profile"
+components = ("db", "bcrypt", "smtp")
+unsafe_characters = re.compile(r"[^\w.-]+")
+
+
+# Signed with the SECRET_KEY, so only whoever holds it can mint one, with
+# `python -m app.utils.profiling [--label slow-search]`
+@lru_cache(maxsize=1)
+def get_token_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(settings.SECRET_KEY, salt="request-profile")
+
+
+def create_profile_token(label: str = "manual") -> str:
+    return get_token_serializer().dumps(label)
+
+
+def verify_profile_token(token: str) -> Optional[str]:
+    """Label of a valid token, None when it is forged or expired."""
+    try:
+        return get_token_serializer().loads(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except BadSignature:
+        return None
+
+
+def profiles_dir() -> str:
+    return settings.PROFILING_DIR or os.path.join(
+        tempfile.gettempdir(), "procurement-profiles"
+    )
+
+
+def prune_profiles(directory: str, keep: int) -> None:
+    """Deletes all but the `keep` newest profiles in `directory`."""
+    profiles = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".prof"):
+                continue
+            try:
+                profiles.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                # Pruned meanwhile by another worker sharing the directory
+                continue
+    profiles.sort(reverse=True)
+    for _, path in profiles[max(keep, 0) :]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _function_name(function) -> str:
+    filename, line, name = function
+    if filename == "~":
+        return name  # built-in
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware running the requests carrying a valid X-Profile-Token
+    under cProfile. The stats are written as a pstats file to PROFILING_DIR
+    and the X-Profile response header summarizes the total time, the time
+    spent in the database, bcrypt and SMTP, the top functions by own time and
+    the file name. Requests without the header only pay for a scan of their
+    header names.
+
+    One request is profiled at a time, others are served unprofiled with an
+    X-Profile: busy header. cProfile traces the loop thread, so code of
+    concurrent requests running while the profiled one awaits is included;
+    the component times are the request's own. The profile stops when the
+    response starts, the body of streaming responses is not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._active = False
+        self._sequence = itertools.count(1)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = next(
+            (value for name, value in scope["headers"] if name == token_header), None
+        )
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        label = verify_profile_token(token.decode("latin-1"))
+        if label is None or self._active:
+            rejected = "invalid token" if label is None else "busy"
+
+            async def rejection() -> str:
+                return rejected
+
+            await self.app(scope, receive, self._with_summary(send, rejection))
+            return
+        await self._profile(scope, receive, send, str(label))
+
+    def _with_summary(self, send, summary):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                text = await summary()
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (summary_header, text.encode("latin-1", "replace"))
+                ]
+            await send(message)
+
+        return send_wrapper
+
+    async def _profile(self, scope, receive, send, label: str) -> None:
+        self._active = True
+        totals: Dict[str, List[float]] = {}
+        context_token = profiled_components.set(totals)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        summary: Optional[str] = None
+
+        async def finish() -> str:
+            nonlocal summary
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            summary = await run_in_threadpool(
+                self._save, profiler, scope, label, elapsed, totals
+            )
+            return summary
+
+        profiler.enable()
+        try:
+            await self.app(scope, receive, self._with_summary(send, finish))
+        finally:
+            profiler.disable()
+            profiled_components.reset(context_token)
+            try:
+                if summary is None:
+                    # No response was started, keep the profile of the failure
+                    await finish()
+            finally:
+                self._active = False
+
+    def _save(
+        self,
+        profiler: cProfile.Profile,
+        scope,
+        label: str,
+        elapsed: float,
+        totals: Dict[str, List[float]],
+    ) -> str:
+        stats = pstats.Stats(profiler)
+        directory = profiles_dir()
+        name = "-".join(
+            (
+                time.strftime("%Y%m%dT%H%M%S"),
+                label,
+                scope["method"],
+                scope["path"].strip("/") or "root",
+                f"{os.getpid()}.{next(self._sequence)}",
+            )
+        )
+        filename = unsafe_characters.sub("_", name)[:150] + ".prof"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            stats.dump_stats(os.path.join(directory, filename))
+        except OSError:
+            # The summary is still worth returning
+            logger.exception("Could not write the request profile to %s", directory)
+            filename = "unsaved"
+        else:
+            try:
+                prune_profiles(directory, settings.PROFILING_MAX_FILES)
+            except OSError:
+                logger.exception("Could not prune the profiles in %s", directory)
+
+        # The loop waiting in select/epoll is idle time, not work of the request
+        top = sorted(
+            (
+                (function, entry)
+                for function, entry in stats.stats.items()
+                if not (function[0] == "~" and "select." in function[2])
+            ),
+            key=lambda item: item[1][2],
+            reverse=True,
+        )
+        parts = [f"total={elapsed * 1000:.1f}ms"]
+        for component in components:
+            count, seconds = totals.get(component, (0, 0.0))
+            parts.append(f"{component}={seconds * 1000:.1f}ms/{count}")
+        parts.append(
+            "top="
+            + ", ".join(
+                f"{_function_name(function)} {entry[2] * 1000:.1f}ms"
+                for function, entry in top[: settings.PROFILING_TOP_FUNCTIONS]
+            )
+        )
+        parts.append(f"file={filename}")
+        return "; ".join(parts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create a request profiling token")
+    parser.add_argument("--label", default="manual", help="named in the artifacts")
+    args = parser.parse_args()
+    print(create_profile_token(args.label))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from app.db.database import get_database
+from app.db.repositories import UserRepository
+from app.models.models import User
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def _hash_key() -> bytes:
+    # Derived, so the key signing access tokens is never used as is
+    return hashlib.sha256(b"refresh-token:" + settings.SECRET_KEY.encode()).digest()
+
+
+def hash_refresh_token(token: str) -> bytes:
+    """
+    Keyed SHA-256 of a refresh token, the key it is stored and looked up by.
+    Tokens are random, so a fast hash is enough where passwords need bcrypt,
+    and without the SECRET_KEY a leaked table cannot be used.
+    """
+    return hmac.new(_hash_key(), token.encode(), hashlib.sha256).digest()
+
+
+async def issue_refresh_token(
+    repository: UserRepository, user: User, expires_at: Optional[datetime] = None
+) -> str:
+    token = secrets.token_urlsafe(32)
+    if expires_at is None:
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            days=settings.REFRESH_TOKEN_EXPIRE_DAYS
+        )
+    await repository.add_refresh_token(
+        user.id, user.token_version or 0, hash_refresh_token(token), expires_at
+    )
+    return token
+
+
+async def rotate_refresh_token(
+    repository: UserRepository, token: str
+) -> Tuple[User, str]:
+    """
+    Exchanges a refresh token for its user and a new refresh token expiring
+    with the old one. Tokens are single use; unknown, expired and already used
+    tokens, and those issued before a password change, are rejected with 401.
+    """
+    async with repository.database.transaction():
+        row = await repository.take_refresh_token(hash_refresh_token(token))
+        if row is not None:
+            user = await repository.get_by_id(row["user_id"])
+            if user is not None and (user.token_version or 0) == row["token_version"]:
+                new_token = await issue_refresh_token(
+                    repository, user, expires_at=row["expires_at"]
+                )
+                return user, new_token
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+class RefreshTokenPruner:
+    """Deletes expired refresh tokens every `interval` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def prune(self) -> None:
+        repository = UserRepository(get_database())
+        await repository.prune_refresh_tokens(datetime.now(timezone.utc))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.prune()
+            except Exception:
+                logger.exception("Refresh token pruning failed")
+
+
+refresh_token_pruner = RefreshTokenPruner(settings.REFRESH_TOKEN_PRUNE_SECONDS)
@@ -0,0 +1,24 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for content that is already trusted and JSON-ready, such as
+    the public user records built by the repository. Returning it directly
+    from a route skips FastAPI's response_model validation and
+    jsonable_encoder pass; response_model still documents the shape.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
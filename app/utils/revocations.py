@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from app.db.database import get_database
+from app.db.repositories import UserRepository
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Version recorded for deleted users, above any version a token can carry
+DELETED = 2**31 - 1
+
+
+def _timestamp(value: datetime) -> float:
+    # SQLite hands back naive datetimes, they are stored in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class RevocationTable:
+    """
+    In-memory copy of the token revocations recorded in the last
+    `retention` seconds, so stateless tokens can be checked without a
+    database lookup. Revocations made by this process apply immediately,
+    those made by other workers once the table is refreshed, every
+    `interval` seconds. Older revocations are dropped: every token issued
+    before them has expired by then.
+    """
+
+    def __init__(self, interval: float, retention: float):
+        self.interval = interval
+        self.retention = retention
+        # user id -> (minimum token version, revocation timestamp)
+        self._entries: Dict[int, Tuple[int, float]] = {}
+        self._refreshed_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_revoked(self, user_id: int, token_version: int, issued_at: float) -> bool:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False
+        min_version, revoked_at = entry
+        # The issue time keeps tokens of a new user reusing a deleted id valid
+        return token_version < min_version and issued_at <= revoked_at
+
+    def revoke(self, user_id: int, token_version: int, revoked_at: datetime) -> None:
+        timestamp = _timestamp(revoked_at)
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= timestamp:
+            self._entries[user_id] = (token_version, timestamp)
+
+    async def refresh(self) -> None:
+        repository = UserRepository(get_database())
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=self.retention)
+        since = cutoff
+        if self._refreshed_at is not None:
+            # Overlap the previous read to catch rows committed out of order
+            since = max(cutoff, self._refreshed_at - timedelta(seconds=self.interval))
+        for row in await repository.revocations_since(since):
+            self.revoke(row["user_id"], row["token_version"], row["revoked_at"])
+        self._refreshed_at = now
+
+        expired = [
+            user_id
+            for user_id, (_, revoked_at) in self._entries.items()
+            if revoked_at < cutoff.timestamp()
+        ]
+        for user_id in expired:
+            del self._entries[user_id]
+        if expired:
+            await repository.prune_revocations(cutoff)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Token revocation refresh failed")
+
+
+revocation_table = RevocationTable(
+    interval=settings.TOKEN_REVOCATION_REFRESH_SECONDS,
+    retention=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60 + 60,
+)
+
+
+async def revoke_user_tokens(
+    repository: UserRepository, user_id: int, token_version: int = DELETED
+) -> None:
+    """
+    Records that the user's tokens older than `token_version`, its already
+    bumped version, stop working and deletes its refresh tokens; deleted
+    users use the default. Run it in the same transaction as the password
+    change or delete that requires it.
+    """
+    revoked_at = await repository.revoke_tokens(user_id, token_version)
+    await repository.delete_refresh_tokens([user_id])
+    revocation_table.revoke(user_id, token_version, revoked_at)
+
+
+async def revoke_users_tokens(
+    repository: UserRepository, token_versions: Dict[int, int]
+) -> None:
+    """`revoke_user_tokens` for several users at once, {user_id: token_version}."""
+    revoked_at = await repository.revoke_tokens_many(token_versions)
+    await repository.delete_refresh_tokens(list(token_versions))
+    for user_id, token_version in token_versions.items():
+        revocation_table.revoke(user_id, token_version, revoked_at)
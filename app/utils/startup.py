@@ -0,0 +1,59 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+from app.utils.metrics import Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Wall time spent importing the app and in each startup step, in the order
+    they ran. Logged once the app is ready and exported as startup_seconds,
+    so a startup budget can be watched per step.
+    """
+
+    def __init__(self):
+        self.steps: Dict[Tuple[str, str], float] = {}
+
+    def record(self, phase: str, step: str, seconds: float) -> None:
+        self.steps[(phase, step)] = seconds
+
+    @contextmanager
+    def step(self, step: str, phase: str = "startup") -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, step, time.perf_counter() - started)
+
+    def total(self, phase: str) -> float:
+        return sum(seconds for (p, _), seconds in self.steps.items() if p == phase)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        report: Dict[str, Dict[str, float]] = {}
+        for (phase, step), seconds in self.steps.items():
+            report.setdefault(phase, {})[step] = round(seconds * 1000, 3)
+        return report
+
+    def log(self) -> None:
+        for phase, steps in self.as_dict().items():
+            logger.info(
+                "%s took %.1f ms: %s",
+                phase,
+                self.total(phase) * 1000,
+                ", ".join(f"{step}={ms:.1f}ms" for step, ms in steps.items()),
+            )
+
+
+startup_report = StartupReport()
+
+registry.register(
+    Gauge(
+        "startup_seconds",
+        "Time spent importing the app and in each startup step",
+        ("phase", "step"),
+        callback=lambda: list(startup_report.steps.items()),
+    )
+)
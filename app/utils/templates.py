@@ -0,0 +1,70 @@
+import hashlib
+import os
+import re
+from types import MappingProxyType
+from typing import Callable, List, Mapping, Optional
+from fastapi import status
+from fastapi.responses import HTMLResponse, Response
+
+placeholder_pattern = re.compile(r"{{\s*(\w+)\s*}}")
+
+
+def compile_template(text: str) -> Callable[..., str]:
+    """
+    Splits a template on its `{{name}}` placeholders once and returns a render
+    function, so rendering is a single join instead of a rescan per value.
+    Placeholders missing from the render arguments are rendered empty.
+    """
+    parts: List[str] = placeholder_pattern.split(text)
+    # Even indexes hold literal text, odd indexes hold placeholder names
+    literals = parts[0::2]
+    names = parts[1::2]
+
+    def render(**context) -> str:
+        chunks = [literals[0]]
+        for name, literal in zip(names, literals[1:]):
+            chunks.append(str(context.get(name, "")))
+            chunks.append(literal)
+        return "".join(chunks)
+
+    return render
+
+
+def load_template(path: str) -> Callable[..., str]:
+    with open(path, "r") as file:
+        return compile_template(file.read())
+
+
+def load_templates_dir(path: str) -> Mapping[str, Callable[..., str]]:
+    """Compiles every .html file in `path` into a read-only name -> render map."""
+    return MappingProxyType(
+        {
+            name: load_template(os.path.join(path, name))
+            for name in sorted(os.listdir(path))
+            if name.endswith(".html")
+        }
+    )
+
+
+class PrerenderedPage:
+    """
+    A page that does not depend on the request, rendered once and kept as
+    bytes with a strong ETag so repeated hits cost no rendering at all.
+    """
+
+    def __init__(self, html: str, max_age: int = 3600):
+        self.body = html.encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"public, max-age={max_age}",
+        }
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            if "*" in tags or self.etag in tags:
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED, headers=self.headers
+                )
+        return HTMLResponse(self.body, headers=self.headers)
@@ -0,0 +1,42 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Mapping
+from app.db.repositories import public_fields, public_record
+
+# Rows are grouped into chunks of roughly this size before each send
+chunk_bytes = 64 * 1024
+
+
+def csv_value(value):
+    # Booleans as JSON writes them, which the importer and to_bool read back
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+async def iter_ndjson(rows: AsyncIterator[Mapping]) -> AsyncIterator[bytes]:
+    buffer = io.BytesIO()
+    async for row in rows:
+        buffer.write(json.dumps(public_record(row)).encode())
+        buffer.write(b"\n")
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer = io.BytesIO()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def iter_csv(rows: AsyncIterator[Mapping]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(public_fields)
+    async for row in rows:
+        record = public_record(row)
+        writer.writerow([csv_value(record[field]) for field in public_fields])
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
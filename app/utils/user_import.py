@@ -0,0 +1,211 @@
+import csv
+import json
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from app.db.repositories import UserRepository
+from app.mails.outbox import enqueue_emails, outbox_row
+from app.models.models import User
+from app.schema.user_schema import UserCreate
+from app.utils.passwords import password_hasher
+
+# (row number, parsed record, parse error)
+ImportRecord = Tuple[int, Optional[dict], Optional[str]]
+
+
+def decode_line(line: bytes) -> Optional[str]:
+    """The line as text, None if it is not valid UTF-8."""
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int
+) -> AsyncIterator[Optional[str]]:
+    """
+    Splits a streamed body into lines while holding at most one partial line.
+    Lines are measured in bytes, before decoding; a newline byte never occurs
+    inside a multi-byte UTF-8 character, so splitting the raw bytes is safe.
+    Lines that are not valid UTF-8 are yielded as None.
+    """
+
+    def too_long() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Lines longer than {max_line_bytes} bytes are not allowed",
+        )
+
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if len(line) > max_line_bytes:
+                raise too_long()
+            yield decode_line(line.rstrip(b"\r"))
+        if len(buffer) > max_line_bytes:
+            raise too_long()
+    if buffer.strip():
+        yield decode_line(buffer)
+
+
+async def iter_records(lines: AsyncIterator[Optional[str]], csv_format: bool):
+    """
+    Yields one ImportRecord per data line. NDJSON lines must hold a JSON
+    object; CSV input takes its field names from the first line and does not
+    support quoted fields spanning several lines.
+    """
+    header: Optional[List[str]] = None
+    number = 0
+    async for line in lines:
+        if line is None:
+            if csv_format and header is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="The CSV header is not valid UTF-8",
+                )
+            number += 1
+            yield number, None, "Invalid UTF-8"
+            continue
+        if not line.strip():
+            continue
+        if csv_format:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            number += 1
+            if len(values) != len(header):
+                yield number, None, "Wrong number of columns"
+            else:
+                yield number, dict(zip(header, values)), None
+            continue
+
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON"
+            continue
+        if isinstance(record, dict):
+            yield number, record, None
+        else:
+            yield number, None, "Expected a JSON object"
+
+
+async def import_batch(
+    batch: List[ImportRecord],
+    repository: UserRepository,
+    confirm_url_for: Callable[[str], str],
+) -> List[dict]:
+    """
+    Validates a batch through UserCreate, hashes the valid passwords in
+    parallel and inserts them, with their confirmation emails, in a single
+    transaction. Returns one result per row, in row order.
+    """
+    results = {}
+    valid: List[Tuple[int, UserCreate]] = []
+    seen = set()
+    for number, record, error in batch:
+        if error is not None:
+            results[number] = {"row": number, "status": "invalid", "errors": [error]}
+            continue
+        try:
+            user = UserCreate(**record)
+        except (ValidationError, TypeError) as validation_error:
+            errors = (
+                validation_error.errors()
+                if isinstance(validation_error, ValidationError)
+                else [str(validation_error)]
+            )
+            results[number] = {"row": number, "status": "invalid", "errors": errors}
+            continue
+        if user.email in seen:
+            results[number] = {
+                "row": number,
+                "email": user.email,
+                "status": "duplicate",
+            }
+            continue
+        seen.add(user.email)
+        valid.append((number, user))
+
+    if valid:
+        try:
+            hashes = await password_hasher.hash_many([u.password for _, u in valid])
+            new_users = [
+                User(**user.dict(exclude={"password"}), password_hash=password_hash)
+                for (_, user), password_hash in zip(valid, hashes)
+            ]
+            async with repository.database.transaction():
+                created = await repository.create_many(new_users)
+                await enqueue_emails(
+                    [
+                        outbox_row(email, "Email Confirmation", confirm_url_for(email))
+                        for email in created
+                    ]
+                )
+        except HTTPException as error:
+            created = None
+            failure = error.detail
+        except Exception as error:
+            created = None
+            failure = str(error)
+
+        for number, user in valid:
+            if created is None:
+                result = {"status": "error", "errors": [failure]}
+            elif user.email in created:
+                result = {"status": "created", "id": created[user.email]}
+            else:
+                result = {"status": "exists"}
+            results[number] = {"row": number, "email": user.email, **result}
+
+    return [results[number] for number in sorted(results)]
+
+
+async def import_users(
+    chunks: AsyncIterator[bytes],
+    csv_format: bool,
+    repository: UserRepository,
+    confirm_url_for: Callable[[str], str],
+    report,
+    batch_size: int,
+    max_line_bytes: int,
+) -> dict:
+    """
+    Streams an NDJSON or CSV upload into the users table batch by batch,
+    writing one NDJSON result line per row to the binary file `report`.
+    Memory use depends on the batch size, not on the size of the upload.
+    """
+    counts = {"total": 0, "created": 0}
+    batch: List[ImportRecord] = []
+
+    async def flush():
+        for result in await import_batch(batch, repository, confirm_url_for):
+            counts["total"] += 1
+            counts["created"] += result["status"] == "created"
+            report.write(json.dumps(result).encode() + b"\n")
+        batch.clear()
+
+    lines = iter_lines(chunks, max_line_bytes)
+    async for record in iter_records(lines, csv_format):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return counts
+
+
+def iter_report(report, chunk_size: int = 65536) -> Iterator[bytes]:
+    try:
+        report.seek(0)
+        chunk = report.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = report.read(chunk_size)
+    finally:
+        report.close()
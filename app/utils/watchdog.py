@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+from app.utils.metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+# Frames under this directory are the application's own code, except for the
+# pass-through ones of the instrumentation, which are on every request's stack
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+pass_through = {
+    os.path.abspath(__file__),
+    os.path.join(app_root, "utils", "metrics.py"),
+}
+# Longest first, file names are shown relative to the first one holding them
+import_roots = sorted(
+    {os.path.dirname(app_root)} | {os.path.abspath(path) for path in sys.path if path},
+    key=len,
+    reverse=True,
+)
+
+event_loop_blocks = registry.register(
+    Counter(
+        "event_loop_blocks_total",
+        "Callbacks that blocked the event loop for longer than the watchdog threshold",
+        ("route",),
+    )
+)
+
+
+def _location(frame: traceback.FrameSummary) -> str:
+    filename = frame.filename
+    for root in import_roots:
+        if filename.startswith(root + os.sep):
+            filename = os.path.relpath(filename, root)
+            break
+    return f"{filename}:{frame.lineno} in {frame.name}"
+
+
+class BlockingSite:
+    """Stalls attributed to one call site, across the routes that hit it."""
+
+    __slots__ = (
+        "call_site",
+        "blocking_frame",
+        "stack",
+        "routes",
+        "count",
+        "total",
+        "max",
+    )
+
+    def __init__(self, call_site: str, blocking_frame: str, stack: List[str]):
+        self.call_site = call_site
+        self.blocking_frame = blocking_frame
+        self.stack = stack
+        self.routes: Dict[str, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, route: str, blocked: float) -> None:
+        self.routes[route] = self.routes.get(route, 0) + 1
+        self.count += 1
+        self.total += blocked
+        self.max = max(self.max, blocked)
+
+    def as_dict(self) -> dict:
+        return {
+            "call_site": self.call_site,
+            "blocking_frame": self.blocking_frame,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "routes": dict(sorted(self.routes.items(), key=lambda item: -item[1])),
+            "stack": self.stack,
+        }
+
+
+class LoopWatchdog:
+    """
+    Finds code blocking the event loop. A callback on the loop beats every
+    `interval` seconds; a side thread checks the beat and, when it is more than
+    `threshold` seconds old, samples the loop thread's stack. The whole await
+    chain of the running coroutine is on that stack, so it gives both the
+    blocking call and the request scope, hence the route.
+
+    Stalls are aggregated by the innermost application frame, the call site
+    to fix. Each new site is logged once; all of them are in `report()`.
+
+    The cost is one loop callback and one thread wake-up per interval, so it
+    can stay on in canaries. Code blocking in C without releasing the GIL
+    cannot be sampled until it returns; those stalls are counted as unsampled.
+    """
+
+    def __init__(self):
+        self.threshold = 0.1
+        self.interval = 0.02
+        self.max_sites = 200
+        self.stack_depth = 30
+        self.sites: Dict[Tuple[str, str], BlockingSite] = {}
+        self.stalls = 0
+        self.unsampled = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._routes: Dict[Callable, str] = {}
+        # Written by the loop thread only
+        self._beat = 0.0
+        self._seq = 0
+        # Sample of the ongoing stall, handed from the side thread to the loop
+        self._pending: Optional[Tuple[int, Tuple[str, str], str, List[str]]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.02,
+        max_sites: int = 200,
+        stack_depth: int = 30,
+    ) -> None:
+        """Starts watching the running loop, must be called from its thread."""
+        if self.running:
+            return
+        self.threshold = threshold
+        self.interval = min(interval, threshold)
+        self.max_sites = max_sites
+        self.stack_depth = stack_depth
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopping.clear()
+        self._tick()
+        self._thread = threading.Thread(
+            target=self._watch, name="event-loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._pending = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.sites = {}
+            self.stalls = 0
+            self.unsampled = 0
+
+    def _tick(self) -> None:
+        """Heartbeat, runs on the loop; also closes the stall that delayed it."""
+        now = time.monotonic()
+        if self._beat:
+            blocked = now - self._beat - self.interval
+            if blocked >= self.threshold:
+                pending, self._pending = self._pending, None
+                if pending is not None and pending[0] == self._seq:
+                    self._record(pending[1], pending[2], pending[3], blocked)
+                else:
+                    with self._lock:
+                        self.stalls += 1
+                        self.unsampled += 1
+                    event_loop_blocks.inc("unsampled")
+        self._beat = now
+        self._seq += 1
+        self._handle = self._loop.call_at(self._loop.time() + self.interval, self._tick)
+
+    def _watch(self) -> None:
+        sampled = -1
+        while not self._stopping.wait(self.interval):
+            seq = self._seq
+            if seq == sampled or not self._beat:
+                continue
+            if time.monotonic() - self._beat - self.interval < self.threshold:
+                continue
+            sampled = seq
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            try:
+                sample = self._sample(frame)
+            except Exception:
+                logger.exception("Could not sample the blocked event loop")
+                continue
+            finally:
+                del frame
+            # The loop moved on while sampling, the stack is not the stall's
+            if self._seq == seq:
+                self._pending = (seq,) + sample
+
+    def _sample(self, frame) -> Tuple[Tuple[str, str], str, List[str]]:
+        route = self._frame_route(frame)
+        stack = traceback.StackSummary.extract(
+            traceback.walk_stack(frame), limit=self.stack_depth
+        )
+        blocking_frame = _location(stack[0])
+        call_site = next(
+            (
+                _location(summary)
+                for summary in stack
+                if summary.filename.startswith(app_root + os.sep)
+                and summary.filename not in pass_through
+            ),
+            blocking_frame,
+        )
+        lines = [_location(summary) for summary in reversed(stack)]
+        return (call_site, blocking_frame), route, lines
+
+    def _frame_route(self, frame) -> str:
+        """Route of the request whose coroutine is on the stack."""
+        request_scope = None
+        while frame is not None:
+            if "scope" in frame.f_code.co_varnames:
+                scope = frame.f_locals.get("scope")
+                if isinstance(scope, dict) and scope.get("type") == "http":
+                    if scope.get("endpoint") is not None:
+                        return self._route_name(scope)
+                    request_scope = request_scope or scope
+            frame = frame.f_back
+        if request_scope is not None:
+            return f"{request_scope.get('method', '')} unmatched"
+        return "background"
+
+    def _route_name(self, scope) -> str:
+        endpoint = scope["endpoint"]
+        path = self._routes.get(endpoint)
+        if path is None:
+            self._routes = {
+                route.endpoint: route.path
+                for route in scope["app"].router.routes
+                if hasattr(route, "endpoint")
+            }
+            path = self._routes.get(endpoint, "unmatched")
+        return f"{scope.get('method', '')} {path}"
+
+    def _record(
+        self, key: Tuple[str, str], route: str, stack: List[str], blocked: float
+    ) -> None:
+        with self._lock:
+            self.stalls += 1
+            site = self.sites.get(key)
+            new = site is None
+            if new:
+                if len(self.sites) >= self.max_sites:
+                    key = ("other", "other")
+                    site = self.sites.get(key)
+                if site is None:
+                    site = self.sites[key] = BlockingSite(key[0], key[1], stack)
+            site.add(route, blocked)
+        event_loop_blocks.inc(route)
+        if new:
+            logger.warning(
+                "Event loop blocked for %.0f ms at %s (%s), stack:\n  %s",
+                blocked * 1000,
+                key[0],
+                route,
+                "\n  ".join(stack),
+            )
+
+    def report(self) -> dict:
+        with self._lock:
+            sites = sorted(self.sites.values(), key=lambda site: -site.total)
+            return {
+                "running": self.running,
+                "threshold_ms": self.threshold * 1000,
+                "interval_ms": self.interval * 1000,
+                "stalls": self.stalls,
+                "unsampled": self.unsampled,
+                "sites": [site.as_dict() for site in sites],
+            }
+
+
+loop_watchdog = LoopWatchdog()
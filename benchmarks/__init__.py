@@ -0,0 +1,19 @@
+"""
+Offline benchmarks for the users API.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks --users 5000 --concurrency 16 --requests 500
+    python -m benchmarks.serialization
+    python -m benchmarks.queries
+    python -m benchmarks.sqlite_profile
+    python -m benchmarks.search --users 1000000
+    python -m benchmarks.startup --runs 5
+
+The load suite seeds a throwaway SQLite database, starts the app in-process
+behind an ASGI client with a local SMTP stub in place of the mail server, and
+prints throughput and p50/p95/p99 latency per endpoint as JSON. The app's own
+config.ini is still read, only the database and mail server are overridden.
+The queries run counts the database statements each route issues and fails
+when one goes over its budget; the startup run does the same with the import
+and startup time of a fresh worker.
+"""
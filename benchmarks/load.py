@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+from app.settings import mail_config, settings
+from benchmarks.seed import password, seed_database, seeded_email
+from benchmarks.smtp_stub import SMTPStub
+
+
+class Context:
+    def __init__(self, users: int, headers: Dict[str, str], serializer):
+        self.users = users
+        self.headers = headers
+        self.serializer = serializer
+        self.run_id = int(time.time() * 1000)
+
+    def random_id(self) -> int:
+        return random.randint(1, self.users)
+
+
+class Scenario(NamedTuple):
+    name: str
+    call: Callable[..., Awaitable]
+    expected: tuple = (200,)
+
+
+async def token(client, context: Context, number: int):
+    return await client.post(
+        "/api/v1/users/token",
+        data={"username": seeded_email(context.random_id()), "password": password},
+    )
+
+
+async def me(client, context: Context, number: int):
+    return await client.get("/api/v1/users/me", headers=context.headers)
+
+
+async def list_users(client, context: Context, number: int):
+    return await client.get(
+        "/api/v1/users", params={"limit": 100}, headers=context.headers
+    )
+
+
+async def get_user(client, context: Context, number: int):
+    return await client.get(
+        f"/api/v1/users/{context.random_id()}", headers=context.headers
+    )
+
+
+async def register(client, context: Context, number: int):
+    return await client.post(
+        "/api/v1/users/register",
+        json={
+            "name": "bench",
+            "last_name": "register",
+            "email": f"new{context.run_id}-{number}@bench.example.com",
+            "password": password,
+        },
+    )
+
+
+async def update(client, context: Context, number: int):
+    return await client.put(
+        f"/api/v1/users/update/{context.random_id()}",
+        json={"name": f"renamed{number}"},
+        headers=context.headers,
+    )
+
+
+async def confirm(client, context: Context, number: int):
+    token = context.serializer.dumps(
+        seeded_email(context.random_id()), salt="email-confirm-salt"
+    )
+    return await client.get(f"/api/v1/users/confirm-email/{token}")
+
+
+scenarios = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("token", token),
+        Scenario("me", me),
+        Scenario("list", list_users),
+        Scenario("get", get_user),
+        Scenario("register", register, (201,)),
+        Scenario("update", update),
+        Scenario("confirm", confirm),
+    )
+}
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+async def drive(
+    client, scenario: Scenario, context: Context, requests: int, concurrency: int
+) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        for number in counter:
+            if number >= requests:
+                return
+            started = time.perf_counter()
+            try:
+                response = await scenario.call(client, context, number)
+                ok = response.status_code in scenario.expected
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    to_ms = 1000.0
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * to_ms, 3) if ordered else 0.0,
+            "p50": round(percentile(ordered, 50) * to_ms, 3),
+            "p95": round(percentile(ordered, 95) * to_ms, 3),
+            "p99": round(percentile(ordered, 99) * to_ms, 3),
+            "max": round(ordered[-1] * to_ms, 3) if ordered else 0.0,
+        },
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure(database_path: str, stub: SMTPStub) -> None:
+    """Points the app at the benchmark database and SMTP stub."""
+    # Overrides must happen before the app modules read the settings
+    settings.DATABASE_URI = f"sqlite:///{database_path}"
+    settings.DATABASE_AUTO_MIGRATE = False
+    # Every simulated client shares one address, measure the API not the limiter
+    settings.LOGIN_IP_PER_MINUTE = 0
+    settings.LOGIN_EMAIL_PER_MINUTE = 0
+    mail_config.MAIL_SERVER = "127.0.0.1"
+    mail_config.MAIL_PORT = stub.port
+    mail_config.MAIL_SSL_TLS = False
+    mail_config.MAIL_STARTTLS = False
+    mail_config.USE_CREDENTIALS = False
+    mail_config.VALIDATE_CERTS = False
+
+
+async def run(args: argparse.Namespace, database_path: str, stub: SMTPStub) -> dict:
+    configure(database_path, stub)
+
+    import httpx
+    from app.api.v1.routes.users import serializer
+    from app.main import app
+    from app.utils.functions import create_jwt_token
+
+    await app.router.startup()
+    try:
+        access_token = create_jwt_token({"sub": seeded_email(1)}).access_token
+        context = Context(
+            args.users, {"Authorization": f"Bearer {access_token}"}, serializer
+        )
+        results = {}
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            for name in args.scenarios:
+                scenario = scenarios[name]
+                if args.warmup:
+                    await drive(client, scenario, context, args.warmup, 1)
+                results[name] = await drive(
+                    client, scenario, context, args.requests, args.concurrency
+                )
+                print(
+                    f"{name}: {results[name]['throughput_rps']} req/s", file=sys.stderr
+                )
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Users API load benchmark")
+    parser.add_argument("--users", type=int, default=1000, help="users to seed")
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="unrecorded requests")
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=list(scenarios),
+        help=f"comma separated subset of {','.join(scenarios)}",
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(scenarios)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    random.seed(args.seed)
+
+    stub = SMTPStub()
+    stub.start()
+    with tempfile.TemporaryDirectory(prefix="users-bench-") as directory:
+        database_path = os.path.join(directory, "bench.sqlite")
+        seed_database(f"sqlite:///{database_path}", args.users)
+        try:
+            results = asyncio.run(run(args, database_path, stub))
+        finally:
+            stub.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "users": args.users,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "emails_received": stub.received,
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
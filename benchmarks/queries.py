@@ -0,0 +1,274 @@
+"""
+Database statements issued per request by each users route, counted from the
+app's own db_query_duration_seconds histogram. Every route has a budget and
+the run exits with status 1 when one goes over it. The test suite runs the
+same steps against the same budgets, see tests/test_query_budgets.py.
+
+Run with `python -m benchmarks.queries [--stateless] [--output report.json]`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+from typing import Awaitable, Callable, Dict, NamedTuple
+from app.settings import settings
+from benchmarks.load import configure
+from benchmarks.seed import password, seed_database, seeded_email
+from benchmarks.smtp_stub import SMTPStub
+
+target_email = "queries@bench.example.com"
+target_password = "Queries!Passw0rd"
+
+
+class Step(NamedTuple):
+    name: str
+    call: Callable[..., Awaitable]
+    budget: int
+    expected: int = 200
+
+
+async def register(client, state: dict):
+    return await client.post(
+        "/api/v1/users/register",
+        json={
+            "name": "queries",
+            "last_name": "bench",
+            "email": target_email,
+            "password": target_password,
+        },
+    )
+
+
+async def token(client, state: dict):
+    response = await client.post(
+        "/api/v1/users/token",
+        data={"username": target_email, "password": target_password},
+    )
+    state["target"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    state["refresh_token"] = response.json()["refresh_token"]
+    return response
+
+
+async def refresh(client, state: dict):
+    response = await client.post(
+        "/api/v1/users/token/refresh",
+        json={"refresh_token": state["refresh_token"]},
+    )
+    state["target"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return response
+
+
+async def me(client, state: dict):
+    response = await client.get("/api/v1/users/me", headers=state["target"])
+    state["id"] = response.json()["id"]
+    return response
+
+
+async def get_user(client, state: dict):
+    response = await client.get(f"/api/v1/users/{state['id']}", headers=state["admin"])
+    state["user_etag"] = response.headers["ETag"]
+    return response
+
+
+async def get_user_not_modified(client, state: dict):
+    return await client.get(
+        f"/api/v1/users/{state['id']}",
+        headers={**state["admin"], "If-None-Match": state["user_etag"]},
+    )
+
+
+async def list_users(client, state: dict):
+    response = await client.get(
+        "/api/v1/users", params={"limit": 100}, headers=state["admin"]
+    )
+    state["page_etag"] = response.headers["ETag"]
+    return response
+
+
+async def list_users_not_modified(client, state: dict):
+    return await client.get(
+        "/api/v1/users",
+        params={"limit": 100},
+        headers={**state["admin"], "If-None-Match": state["page_etag"]},
+    )
+
+
+async def get_batch(client, state: dict):
+    # Three other users, the target and a missing one
+    ids = [*state["others"][:3], state["id"], 999999]
+    return await client.get(
+        "/api/v1/users/batch",
+        params={"ids": ",".join(map(str, ids))},
+        headers=state["admin"],
+    )
+
+
+async def update_batch(client, state: dict):
+    first, second, third, fourth = state["others"]
+    return await client.post(
+        "/api/v1/users/batch",
+        json={
+            "operations": [
+                {"op": "update", "id": first, "data": {"name": "renamed"}},
+                {"op": "update", "id": second, "data": {"last_name": "renamed"}},
+                {"op": "delete", "id": third},
+                {"op": "delete", "id": fourth},
+            ]
+        },
+        headers=state["admin"],
+    )
+
+
+async def update(client, state: dict):
+    return await client.put(
+        f"/api/v1/users/update/{state['id']}",
+        json={"name": "renamed"},
+        headers=state["admin"],
+    )
+
+
+async def update_with_password(client, state: dict):
+    return await client.put(
+        f"/api/v1/users/update/{state['id']}",
+        json={"password": target_password},
+        headers=state["admin"],
+    )
+
+
+async def confirm(client, state: dict):
+    token = state["serializer"].dumps(target_email, salt="email-confirm-salt")
+    return await client.get(f"/api/v1/users/confirm-email/{token}")
+
+
+async def reset_password(client, state: dict):
+    return await client.post(
+        "/api/v1/users/reset-password",
+        json={"email": target_email},
+        headers={"client-url": "http://bench"},
+    )
+
+
+async def update_password(client, state: dict):
+    token = state["serializer"].dumps(target_email, salt="email-confirm-salt")
+    return await client.patch(
+        f"/api/v1/users/update-password/{token}", json={"password": target_password}
+    )
+
+
+async def delete(client, state: dict):
+    return await client.delete(
+        f"/api/v1/users/delete/{state['id']}", headers=state["admin"]
+    )
+
+
+# In order, later steps use what earlier ones stored in the state
+steps = (
+    Step("register", register, 2, 201),  # user + outbox insert
+    Step("token", token, 2),  # + refresh token insert
+    Step("refresh", refresh, 3),  # take the old one, read the user, insert
+    Step("me", me, 1),  # 0 with stateless tokens
+    Step("get", get_user, 1),
+    Step("get_not_modified", get_user_not_modified, 1, 304),  # version only
+    Step("list", list_users, 1),
+    Step("list_not_modified", list_users_not_modified, 1, 304),
+    Step("get_batch", get_batch, 1),
+    Step("update_batch", update_batch, 5),  # one per update + deletes + revocations
+    Step("update", update, 1),
+    Step("update_with_password", update_with_password, 3),  # + revocations
+    Step("confirm", confirm, 1),
+    Step("reset_password", reset_password, 1),
+    Step("update_password", update_password, 3),  # + revocations
+    Step("delete", delete, 3, 204),  # + revocations
+)
+
+
+async def run(database_path: str, stub: SMTPStub) -> Dict[str, dict]:
+    configure(database_path, stub)
+
+    import httpx
+    from app.api.v1.routes.users import serializer
+    from app.main import app
+    from app.mails.outbox import outbox_worker
+    from app.utils.functions import create_jwt_token
+    from app.utils.metrics import db_queries
+    from app.utils.revocations import revocation_table
+
+    await app.router.startup()
+    # Background tasks would add their own statements to the counts
+    await outbox_worker.stop()
+    await revocation_table.stop()
+    try:
+        admin_token = create_jwt_token({"sub": seeded_email(1)}).access_token
+        state = {
+            "admin": {"Authorization": f"Bearer {admin_token}"},
+            "serializer": serializer,
+            # Seeded users the batch steps read, update and delete
+            "others": [2, 3, 4, 5],
+        }
+        results = {}
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            # Resolve the admin once so its lookup is not charged to a route
+            await client.get("/api/v1/users/me", headers=state["admin"])
+            for step in steps:
+                before = Counter(db_queries.counts())
+                response = await step.call(client, state)
+                statements = Counter(db_queries.counts())
+                statements.subtract(before)
+                issued = {labels[0]: n for labels, n in statements.items() if n}
+                results[step.name] = {
+                    "status": response.status_code,
+                    "ok": response.status_code == step.expected,
+                    "queries": sum(issued.values()),
+                    "budget": step.budget,
+                    "statements": issued,
+                }
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Database statements per route")
+    parser.add_argument(
+        "--stateless", action="store_true", help="issue stateless tokens"
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    settings.TOKEN_STATELESS = args.stateless
+
+    stub = SMTPStub()
+    stub.start()
+    with tempfile.TemporaryDirectory(prefix="users-queries-") as directory:
+        database_path = os.path.join(directory, "queries.sqlite")
+        seed_database(f"sqlite:///{database_path}", 10)
+        try:
+            results = asyncio.run(run(database_path, stub))
+        finally:
+            stub.stop()
+
+    failed = [
+        name
+        for name, result in results.items()
+        if not result["ok"] or result["queries"] > result["budget"]
+    ]
+    output = json.dumps({"routes": results, "failed": failed}, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+    for name, result in results.items():
+        print(
+            f"{name:<22} {result['queries']}/{result['budget']} queries"
+            f"  status {result['status']}",
+            file=sys.stderr,
+        )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Typeahead latency of UserRepository.search on a large users table.
+
+Seeds a throwaway SQLite database with synthetic names and emails, through
+the migrations so the full-text index and its triggers are in place, then
+times a set of queries from broad one letter prefixes to selective words.
+
+Run with `python -m benchmarks.search [--users 1000000] [--repeat 50]`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from sqlalchemy import create_engine
+from app.db.database import create_database
+from app.db.migrate import migrate
+from app.db.repositories import UserRepository
+from app.settings import settings
+from benchmarks.load import percentile
+
+syllables = ("ka", "lo", "mi", "ra", "ne", "to", "sa", "vi", "do", "re")
+syllables += ("an", "el", "jo", "ma", "ri", "be", "ta", "lu", "no", "si")
+domains = ("acme", "corp", "mail", "example")
+queries = ("k", "ka", "kal", "kalo", "kalomi", "ka lo", "acme", "kalomi acme", "zzz")
+
+
+def word() -> str:
+    return "".join(random.choice(syllables) for _ in range(random.randint(2, 4)))
+
+
+def seed(path: str, users: int) -> None:
+    migrate(create_engine(f"sqlite:///{path}"))
+    rows = (
+        (
+            word(),
+            word(),
+            f"{word()}.{number}@{random.choice(domains)}.com",
+            "unused",
+            "0",
+            "2024-01-01 00:00:00.000000",
+        )
+        for number in range(users)
+    )
+    with sqlite3.connect(path) as connection:
+        connection.executemany(
+            "INSERT INTO users (name, last_name, email, password_hash,"
+            " email_confirm, creation_date) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+async def measure(path: str, repeat: int) -> dict:
+    database = create_database(f"sqlite:///{path}")
+    repository = UserRepository(database)
+    await database.connect()
+    report = {}
+    try:
+        for query in queries:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = await repository.search(
+                    query, limit=10, candidates=settings.SEARCH_CANDIDATES
+                )
+                timings.append(time.perf_counter() - started)
+            ordered = sorted(timings)
+            report[query] = {
+                "results": len(rows),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+            }
+    finally:
+        await database.disconnect()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="User search latency")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="users-search-") as directory:
+        path = os.path.join(directory, "search.sqlite")
+        started = time.perf_counter()
+        seed(path, args.users)
+        seeded = time.perf_counter() - started
+        report = asyncio.run(measure(path, args.repeat))
+
+    print(
+        json.dumps(
+            {"users": args.users, "seed_seconds": round(seeded, 1), "queries": report},
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, insert
+from app.db.migrate import migrate
+from app.models.models import User
+from app.utils.passwords import get_pwd_context
+
+# Every seeded user shares this password so logins can pick any of them
+password = "Bench!Passw0rd"
+
+
+def seed_database(url: str, users: int, batch_size: int = 5000) -> None:
+    """Migrates a fresh database at `url` and inserts `users` accounts."""
+    engine = create_engine(url)
+    migrate(engine)
+    password_hash = get_pwd_context().hash(password)
+    now = datetime.now(timezone.utc)
+    table = User.__table__
+    with engine.begin() as connection:
+        for start in range(0, users, batch_size):
+            connection.execute(
+                insert(table),
+                [
+                    {
+                        "name": f"name{number}",
+                        "last_name": f"last{number}",
+                        "email": seeded_email(number),
+                        "password_hash": password_hash,
+                        "email_confirm": number % 2 == 0,
+                        "creation_date": now,
+                    }
+                    for number in range(start + 1, min(start + batch_size, users) + 1)
+                ],
+            )
+    engine.dispose()
+
+
+def seeded_email(number: int) -> str:
+    return f"user{number}@bench.example.com"
@@ -0,0 +1,89 @@
+"""
+Per-row cost of serializing a page of users, before and after the fast path.
+
+before: rows become UserFromDB models, then FastAPI validates the list against
+        response_model=List[UserFromDB], runs jsonable_encoder and JSONResponse
+after:  rows become plain public records rendered by FastJSONResponse
+
+Run with `python -m benchmarks.serialization [--rows 100] [--repeat 2000]`.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.db.repositories import public_record
+from app.schema.user_schema import UserFromDB
+from app.utils.responses import FastJSONResponse, orjson
+
+
+def make_rows(count: int) -> List[dict]:
+    return [
+        {
+            "id": number,
+            "name": f"name{number}",
+            "last_name": f"last{number}",
+            "email": f"user{number}@example.com",
+            "email_confirm": "1" if number % 2 else "0",
+        }
+        for number in range(1, count + 1)
+    ]
+
+
+async def before(rows: List[dict], field) -> bytes:
+    users = [
+        UserFromDB(
+            id=row["id"],
+            name=row["name"],
+            last_name=row["last_name"],
+            email=row["email"],
+            email_confirm=row["email_confirm"],
+        )
+        for row in rows
+    ]
+    content = await serialize_response(field=field, response_content=users)
+    return JSONResponse(content).body
+
+
+async def after(rows: List[dict], field) -> bytes:
+    return FastJSONResponse([public_record(row) for row in rows]).body
+
+
+async def measure(func, rows: List[dict], repeat: int) -> float:
+    field = create_response_field(name="response", type_=List[UserFromDB])
+    await func(rows, field)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await func(rows, field)
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    before_page = asyncio.run(measure(before, rows, args.repeat))
+    after_page = asyncio.run(measure(after, rows, args.repeat))
+    print(
+        json.dumps(
+            {
+                "rows": args.rows,
+                "encoder": "orjson" if orjson is not None else "json",
+                "before_us_per_row": round(before_page / args.rows * 1e6, 3),
+                "after_us_per_row": round(after_page / args.rows * 1e6, 3),
+                "speedup": round(before_page / after_page, 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
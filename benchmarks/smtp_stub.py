@@ -0,0 +1,36 @@
+import socket
+from aiosmtpd.controller import Controller
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class SMTPStub:
+    """Local SMTP server that accepts and counts every message."""
+
+    def __init__(self, port: int = 0):
+        self.port = port or free_port()
+        self.handler = CountingHandler()
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+
+    def start(self) -> None:
+        self.controller.start()
+
+    def stop(self) -> None:
+        self.controller.stop()
+
+    @property
+    def received(self) -> int:
+        return self.handler.received
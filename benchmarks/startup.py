@@ -0,0 +1,142 @@
+"""
+Cold start of a worker: import time of app.main per module and the duration
+of each startup step, from fresh interpreters. Imports are measured with
+`python -X importtime`, the steps by the app's own startup report.
+
+Reported, as the median of the runs:
+- import: total, every app module (cumulative, with what it imports) and the
+  third-party packages (their own modules only)
+- startup: every step of the startup handler and their total
+
+The run exits with status 1 when the import or startup total goes over its
+budget.
+
+Run with `python -m benchmarks.startup [--runs 5] [--import-budget-ms 1500]
+[--startup-budget-ms 500] [--warm-up]`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+def child(database_path: str, warm_up: bool) -> None:
+    """Runs in the measured interpreter, prints the startup report as JSON."""
+    from app.settings import settings
+
+    settings.DATABASE_URI = f"sqlite:///{database_path}"
+    settings.DATABASE_AUTO_MIGRATE = False
+    settings.STARTUP_WARM_UP = warm_up
+
+    from app.main import app
+    from app.utils.startup import startup_report
+
+    async def start_and_stop():
+        await app.router.startup()
+        await app.router.shutdown()
+
+    asyncio.run(start_and_stop())
+    print(json.dumps(startup_report.as_dict()))
+
+
+def parse_importtime(output: str) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """Cumulative ms of the app modules and self ms per third-party package."""
+    modules: Dict[str, float] = {}
+    packages: Dict[str, float] = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        self_us, name = self_us.strip(), name.strip()
+        if not self_us.isdigit():
+            continue  # header line
+        if name == "app" or name.startswith("app."):
+            modules[name] = int(cumulative_us) / 1000
+        else:
+            packages[name.split(".")[0].lstrip("_")] += int(self_us) / 1000
+    return modules, dict(packages)
+
+
+def measure(database_path: str, warm_up: bool) -> dict:
+    # -c rather than -m, so nothing but this module is imported beforehand
+    code = f"from benchmarks.startup import child; child({database_path!r}, {warm_up})"
+    command = [sys.executable, "-X", "importtime", "-c", code]
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    modules, packages = parse_importtime(completed.stderr)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {"modules": modules, "packages": packages, "report": report}
+
+
+def median_of(runs: List[Dict[str, float]], top: int = 0) -> Dict[str, float]:
+    names = {name for run in runs for name in run}
+    medians = {
+        name: round(statistics.median(run.get(name, 0.0) for run in runs), 3)
+        for name in names
+    }
+    ordered = sorted(medians.items(), key=lambda item: item[1], reverse=True)
+    return dict(ordered[:top] if top else ordered)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=1500.0)
+    parser.add_argument("--startup-budget-ms", type=float, default=500.0)
+    parser.add_argument("--packages", type=int, default=15, help="packages shown")
+    parser.add_argument(
+        "--warm-up", action="store_true", help="run the startup warm-up step"
+    )
+    args = parser.parse_args()
+    # Not at the top: the measured interpreters import this module
+    from benchmarks.seed import seed_database
+
+    with tempfile.TemporaryDirectory(prefix="users-startup-") as directory:
+        database_path = os.path.join(directory, "startup.sqlite")
+        seed_database(f"sqlite:///{database_path}", 10)
+        runs = [measure(database_path, args.warm_up) for _ in range(args.runs)]
+
+    import_ms = median_of([run["report"].get("import", {}) for run in runs])
+    steps = median_of([run["report"].get("startup", {}) for run in runs])
+    import_total = import_ms.get("app.main", 0.0)
+    startup_total = round(sum(steps.values()), 3)
+    results = {
+        "import": {
+            "total_ms": import_total,
+            "budget_ms": args.import_budget_ms,
+            "modules_ms": median_of([run["modules"] for run in runs]),
+            "packages_ms": median_of(
+                [run["packages"] for run in runs], top=args.packages
+            ),
+        },
+        "startup": {
+            "total_ms": startup_total,
+            "budget_ms": args.startup_budget_ms,
+            "steps_ms": steps,
+        },
+    }
+    failed = [
+        phase
+        for phase, total, budget in (
+            ("import", import_total, args.import_budget_ms),
+            ("startup", startup_total, args.startup_budget_ms),
+        )
+        if total > budget
+    ]
+    print(
+        json.dumps(
+            {"config": vars(args), "results": results, "failed": failed}, indent=2
+        )
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import socket
+import tempfile
+import pytest
+from app.settings import mail_config, settings
+
+# Like the benchmarks, the app's own config.ini is read and only what the
+# tests depend on is overridden, before the app modules read the settings
+test_dir = tempfile.mkdtemp(prefix="procurement-tests-")
+settings.DATABASE_URI = "sqlite:///" + os.path.join(test_dir, "test.sqlite")
+settings.DATABASE_AUTO_MIGRATE = False
+settings.TOKEN_STATELESS = False
+settings.LOGIN_IP_PER_MINUTE = 0
+settings.LOGIN_EMAIL_PER_MINUTE = 0
+settings.PASSWORD_HASH_USE_PROCESSES = False
+mail_config.MAIL_SERVER = "127.0.0.1"
+mail_config.MAIL_SSL_TLS = False
+mail_config.MAIL_STARTTLS = False
+mail_config.USE_CREDENTIALS = False
+mail_config.VALIDATE_CERTS = False
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def migrated():
+    from app.db.database import get_sync_engine
+    from app.db.migrate import migrate
+
+    migrate(get_sync_engine())
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+async def database():
+    from app.db.database import get_database
+
+    database = get_database()
+    await database.connect()
+    try:
+        yield database
+    finally:
+        await database.disconnect()
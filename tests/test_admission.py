@@ -0,0 +1,39 @@
+from app.utils import admission
+from app.utils.admission import RateLimiter, login_gate
+from tests.test_users import password, register
+
+
+def login(client, email: str):
+    return client.post(
+        "/api/v1/users/token", data={"username": email, "password": password}
+    )
+
+
+def test_login_attempts_over_the_limit_are_rejected(client, monkeypatch):
+    register(client, "limited@example.com")
+    limiter = RateLimiter("email", per_minute=1, burst=2, maxsize=10)
+    monkeypatch.setattr(admission, "login_email_limiter", limiter)
+
+    assert login(client, "limited@example.com").status_code == 200
+    assert login(client, "limited@example.com").status_code == 200
+    response = login(client, "limited@example.com")
+    assert response.status_code == 429
+    assert response.json() == {
+        "detail": "Too many login attempts, please try again later"
+    }
+    assert 0 < int(response.headers["Retry-After"]) <= 60
+    # Other emails have their own budget
+    register(client, "unlimited@example.com")
+    assert login(client, "unlimited@example.com").status_code == 200
+
+
+def test_full_gate_sheds_requests(client, monkeypatch):
+    register(client, "gated@example.com")
+    # Every slot taken and no room to queue
+    monkeypatch.setattr(login_gate, "active", login_gate.limit)
+    monkeypatch.setattr(login_gate, "queue_limit", 0)
+
+    response = login(client, "gated@example.com")
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Server is busy, please try again later"}
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,77 @@
+import pytest
+from app.settings import settings
+from app.utils.functions import encode_cursor
+from tests.test_users import find_id, login, register
+
+
+def get(client, url: str, headers: dict, etag: str = None, **params):
+    if etag is not None:
+        headers = {**headers, "If-None-Match": etag}
+    return client.get(url, headers=headers, params=params)
+
+
+def rename(client, headers: dict, user_id: int, name: str) -> None:
+    response = client.put(
+        f"/api/v1/users/update/{user_id}", headers=headers, json={"name": name}
+    )
+    assert response.status_code == 200
+
+
+def test_user_is_not_modified_until_it_changes(client):
+    register(client, "conditional-admin@example.com")
+    register(client, "conditional-user@example.com")
+    headers = login(client, "conditional-admin@example.com")
+    user_id = find_id(client, headers, "conditional-user@example.com")
+    url = f"/api/v1/users/{user_id}"
+
+    response = get(client, url, headers)
+    etag = response.headers["ETag"]
+    response = get(client, url, headers, etag)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    rename(client, headers, user_id, "Renamed")
+    response = get(client, url, headers, etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["name"] == "renamed"
+
+
+@pytest.mark.parametrize("stateless", [False, True])
+def test_me_is_not_modified_until_it_changes(client, monkeypatch, stateless):
+    monkeypatch.setattr(settings, "TOKEN_STATELESS", stateless)
+    email = f"conditional-me-{int(stateless)}@example.com"
+    register(client, email)
+    headers = login(client, email)
+
+    response = get(client, "/api/v1/users/me", headers)
+    etag = response.headers["ETag"]
+    assert get(client, "/api/v1/users/me", headers, etag).status_code == 304
+
+    rename(client, headers, response.json()["id"], "Renamed")
+    if stateless:
+        # The profile travels in the token, a new one carries the new version
+        headers = login(client, email)
+    response = get(client, "/api/v1/users/me", headers, etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_page_is_not_modified_until_a_user_on_it_changes(client):
+    register(client, "conditional-page@example.com")
+    headers = login(client, "conditional-page@example.com")
+    user_id = find_id(client, headers, "conditional-page@example.com")
+    # The page starting with the user, whatever the other tests created
+    page = {"cursor": encode_cursor("id", {"id": user_id - 1}), "limit": 10}
+
+    response = get(client, "/api/v1/users", headers, **page)
+    etag = response.headers["ETag"]
+    assert response.json()[0]["id"] == user_id
+    response = get(client, "/api/v1/users", headers, etag, **page)
+    assert response.status_code == 304
+
+    rename(client, headers, user_id, "Renamed")
+    response = get(client, "/api/v1/users", headers, etag, **page)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
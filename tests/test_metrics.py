@@ -0,0 +1,25 @@
+from app.api import metrics  # noqa: F401, registers the scraped metrics
+from app.utils.metrics import Counter, registry
+
+
+def test_counter_callback_is_read_when_scraped():
+    totals = {"hit": 1}
+    counter = Counter(
+        "cache_events_total",
+        "Cache events",
+        ("result",),
+        callback=lambda: [((result,), value) for result, value in totals.items()],
+    )
+    counter.inc("stale")
+    totals["hit"] = 3
+    assert counter.header()[1] == "# TYPE cache_events_total counter"
+    assert sorted(counter.samples()) == [
+        'cache_events_total{result="hit"} 3',
+        'cache_events_total{result="stale"} 1',
+    ]
+
+
+def test_principal_cache_events_are_counters():
+    rendered = registry.render()
+    assert "# TYPE principal_cache_events_total counter" in rendered
+    assert 'principal_cache_events_total{result="hit"}' in rendered
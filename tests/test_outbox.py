@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import delete, insert, select, update
+from app.mails import mail_config as mail_module
+from app.mails.outbox import (
+    DEAD,
+    PENDING,
+    SENDING,
+    SENT,
+    OutboxWorker,
+    enqueue_email,
+    outbox_row,
+    outbox_table,
+)
+from app.mails.pool import SMTPConnectionPool
+from tests.conftest import free_port
+
+pytestmark = pytest.mark.anyio
+
+
+class FailingHandler:
+    """Rejects the first `failures` messages with a temporary error."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures:
+            self.failures -= 1
+            return "451 Try again later"
+        self.received += 1
+        return "250 Message accepted"
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    def start(failures: int = 0) -> FailingHandler:
+        handler = FailingHandler(failures)
+        port = free_port()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        servers.append(controller)
+        pool = SMTPConnectionPool(
+            hostname="127.0.0.1",
+            port=port,
+            username=None,
+            password=None,
+            use_tls=False,
+            start_tls=False,
+            validate_certs=False,
+            use_credentials=False,
+            timeout=5,
+        )
+        monkeypatch.setattr(mail_module, "smtp_pool", pool)
+        return handler
+
+    servers = []
+    yield start
+    for controller in servers:
+        controller.stop()
+
+
+@pytest.fixture
+async def outbox(database):
+    await database.execute(delete(outbox_table))
+    try:
+        yield database
+    finally:
+        await mail_module.smtp_pool.close()
+
+
+def make_worker(max_attempts: int = 3) -> OutboxWorker:
+    return OutboxWorker(
+        batch_size=10,
+        poll_interval=1,
+        max_attempts=max_attempts,
+        backoff_seconds=30,
+        backoff_max_seconds=3600,
+        lease_seconds=300,
+    )
+
+
+async def fetch_row(database, outbox_id: int):
+    return await database.fetch_one(
+        select(outbox_table).where(outbox_table.c.id == outbox_id)
+    )
+
+
+async def make_due(database, outbox_id: int) -> None:
+    """Moves the next attempt to the past instead of waiting for the backoff."""
+    await database.execute(
+        update(outbox_table)
+        .where(outbox_table.c.id == outbox_id)
+        .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+    )
+
+
+def seconds_from_now(moment: datetime) -> float:
+    return (moment - datetime.utcnow()).total_seconds()
+
+
+async def test_failed_delivery_is_retried_with_backoff(outbox, smtp_server):
+    handler = smtp_server(failures=2)
+    worker = make_worker(max_attempts=3)
+    outbox_id = await enqueue_email("retry@example.com", "Retry", "http://confirm")
+
+    assert await worker.drain_once() == 1
+    row = await fetch_row(outbox, outbox_id)
+    assert row["status"] == PENDING
+    assert row["attempts"] == 1
+    assert "451" in row["last_error"]
+    # Base delay of 30 seconds, with up to 10% of jitter
+    assert 26 <= seconds_from_now(row["next_attempt_at"]) <= 33
+
+    # Not due yet, nothing is claimed
+    assert await worker.drain_once() == 0
+
+    await make_due(outbox, outbox_id)
+    assert await worker.drain_once() == 1
+    row = await fetch_row(outbox, outbox_id)
+    assert row["status"] == PENDING
+    assert row["attempts"] == 2
+    # The delay doubles with each attempt
+    assert 53 <= seconds_from_now(row["next_attempt_at"]) <= 66
+
+    await make_due(outbox, outbox_id)
+    assert await worker.drain_once() == 1
+    row = await fetch_row(outbox, outbox_id)
+    assert row["status"] == SENT
+    assert row["attempts"] == 2
+    assert row["sent_at"] is not None
+    assert row["last_error"] is None
+    assert handler.received == 1
+
+
+async def test_exhausted_retries_move_to_dead_letter(outbox, smtp_server):
+    handler = smtp_server(failures=10)
+    worker = make_worker(max_attempts=3)
+    outbox_id = await enqueue_email("dead@example.com", "Dead", "http://confirm")
+
+    for attempt in range(1, 4):
+        await make_due(outbox, outbox_id)
+        assert await worker.drain_once() == 1
+        row = await fetch_row(outbox, outbox_id)
+        assert row["attempts"] == attempt
+    assert row["status"] == DEAD
+    assert "451" in row["last_error"]
+
+    # Dead rows are never claimed again, even once their time has come
+    await make_due(outbox, outbox_id)
+    assert await worker.drain_once() == 0
+    assert handler.received == 0
+
+
+async def test_expired_lease_is_reclaimed(outbox, smtp_server):
+    handler = smtp_server()
+    worker = make_worker()
+    now = datetime.utcnow()
+    # Left in `sending` by a worker that crashed, one lease expired and one not
+    ids = []
+    for recipient, offset in (
+        ("expired@example.com", timedelta(seconds=-1)),
+        ("leased@example.com", timedelta(seconds=200)),
+    ):
+        row = outbox_row(recipient, "Lease", "http://confirm")
+        row.update(status=SENDING, attempts=1, next_attempt_at=now + offset)
+        ids.append(await outbox.execute(insert(outbox_table).values(**row)))
+    expired, leased = ids
+
+    assert await worker.drain_once() == 1
+    row = await fetch_row(outbox, expired)
+    assert row["status"] == SENT
+    assert row["attempts"] == 1
+    row = await fetch_row(outbox, leased)
+    assert row["status"] == SENDING
+    assert handler.received == 1
+
+
+async def test_claimed_rows_are_leased(outbox):
+    worker = make_worker()
+    outbox_id = await enqueue_email("lease@example.com", "Lease", "http://confirm")
+
+    rows = await worker._claim()
+    assert [row["id"] for row in rows] == [outbox_id]
+    row = await fetch_row(outbox, outbox_id)
+    assert row["status"] == SENDING
+    assert 295 <= seconds_from_now(row["next_attempt_at"]) <= 300
+    # Another worker polling meanwhile does not get it
+    assert await worker._claim() == []
+
+
+def test_backoff_is_capped():
+    worker = make_worker()
+    assert worker._backoff(30) <= timedelta(seconds=3600 * 1.1)
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+from app.utils.functions import principal_cache
+from app.utils.revocations import revocation_table
+from tests.test_users import find_id, login, register
+
+
+def me(client, headers):
+    return client.get("/api/v1/users/me", headers=headers)
+
+
+def cached_principal(client, email: str) -> dict:
+    register(client, email)
+    headers = login(client, email)
+    assert me(client, headers).status_code == 200
+    hits = principal_cache.hits
+    assert me(client, headers).status_code == 200
+    assert principal_cache.hits == hits + 1
+    return headers
+
+
+def test_update_drops_cached_principal(client):
+    headers = cached_principal(client, "cache-update@example.com")
+    user_id = me(client, headers).json()["id"]
+
+    response = client.put(
+        f"/api/v1/users/update/{user_id}", headers=headers, json={"name": "Renamed"}
+    )
+    assert response.status_code == 200
+    assert me(client, headers).json()["name"] == "renamed"
+
+
+def test_password_change_rejects_cached_token(client):
+    headers = cached_principal(client, "cache-password@example.com")
+    user_id = me(client, headers).json()["id"]
+
+    response = client.put(
+        f"/api/v1/users/update/{user_id}",
+        headers=headers,
+        json={"password": "N3wPassw0rd!"},
+    )
+    assert response.status_code == 200
+    assert me(client, headers).status_code == 401
+
+
+def test_delete_rejects_cached_token(client):
+    headers = cached_principal(client, "cache-delete@example.com")
+    admin = cached_principal(client, "cache-admin@example.com")
+    user_id = find_id(client, admin, "cache-delete@example.com")
+
+    response = client.delete(f"/api/v1/users/delete/{user_id}", headers=admin)
+    assert response.status_code == 204
+    # Looked up again instead of served from the cache
+    assert me(client, headers).status_code == 404
+
+
+def test_revocation_from_another_worker_rejects_cached_token(client):
+    headers = cached_principal(client, "cache-worker@example.com")
+    user_id = me(client, headers).json()["id"]
+
+    # As the revocation table refresh would pick up another worker's change
+    revocation_table.revoke(user_id, 1, datetime.now(timezone.utc))
+    assert me(client, headers).status_code == 401
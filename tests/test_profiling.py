@@ -0,0 +1,13 @@
+import os
+from app.utils.profiling import prune_profiles
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path):
+    for number in range(5):
+        path = tmp_path / f"{number}.prof"
+        path.write_bytes(b"")
+        os.utime(path, (number, number))
+    (tmp_path / "notes.txt").write_text("not a profile")
+
+    prune_profiles(str(tmp_path), 2)
+    assert sorted(os.listdir(tmp_path)) == ["3.prof", "4.prof", "notes.txt"]
@@ -0,0 +1,66 @@
+from collections import Counter
+import httpx
+import pytest
+from app.main import app
+from app.api.v1.routes.users import serializer
+from app.settings import settings
+from app.utils.metrics import db_queries
+from benchmarks.queries import steps
+from tests.test_users import password
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def count_queries():
+    """Statements issued through TimedDatabase while the call runs, by fingerprint."""
+
+    async def count(call) -> tuple:
+        before = Counter(db_queries.counts())
+        result = await call
+        statements = Counter(db_queries.counts())
+        statements.subtract(before)
+        return result, {labels[0]: n for labels, n in statements.items() if n}
+
+    return count
+
+
+@pytest.mark.parametrize("stateless", [False, True])
+async def test_routes_stay_within_their_query_budget(
+    database, count_queries, monkeypatch, stateless
+):
+    monkeypatch.setattr(settings, "TOKEN_STATELESS", stateless)
+    # No lifespan: the outbox worker and revocation refresh would add their
+    # own statements to the counts
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        emails = [f"budget{number}-{int(stateless)}@example.com" for number in range(5)]
+        for email in emails:
+            response = await client.post(
+                "/api/v1/users/register",
+                json={
+                    "name": "Test",
+                    "last_name": "User",
+                    "email": email,
+                    "password": password,
+                },
+            )
+            assert response.status_code == 201, response.text
+        response = await client.post(
+            "/api/v1/users/token", data={"username": emails[0], "password": password}
+        )
+        admin = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await client.get(
+            "/api/v1/users/search", params={"q": "budget"}, headers=admin
+        )
+        others = {user["email"]: user["id"] for user in response.json()}
+        state = {
+            "admin": admin,
+            "serializer": serializer,
+            "others": [others[email] for email in emails[1:]],
+        }
+
+        for step in steps:
+            response, statements = await count_queries(step.call(client, state))
+            assert response.status_code == step.expected, (step.name, response.text)
+            assert sum(statements.values()) <= step.budget, (step.name, statements)
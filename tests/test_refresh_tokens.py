@@ -0,0 +1,52 @@
+from tests.test_users import password, register
+
+
+def token(client, email: str, user_password: str = password) -> dict:
+    response = client.post(
+        "/api/v1/users/token", data={"username": email, "password": user_password}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def refresh(client, refresh_token: str):
+    return client.post(
+        "/api/v1/users/token/refresh", json={"refresh_token": refresh_token}
+    )
+
+
+def test_refresh_tokens_are_single_use(client):
+    register(client, "refresh-rotate@example.com")
+    first = token(client, "refresh-rotate@example.com")["refresh_token"]
+
+    response = refresh(client, first)
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+
+    # The rotated token cannot be used again, the new one can
+    response = refresh(client, first)
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid refresh token"}
+    assert refresh(client, second).status_code == 200
+
+
+def test_password_change_invalidates_refresh_tokens(client):
+    register(client, "refresh-password@example.com")
+    tokens = token(client, "refresh-password@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    user_id = client.get("/api/v1/users/me", headers=headers).json()["id"]
+
+    response = client.put(
+        f"/api/v1/users/update/{user_id}",
+        headers=headers,
+        json={"password": "N3wPassw0rd!"},
+    )
+    assert response.status_code == 200
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_unknown_refresh_token_is_rejected(client):
+    assert refresh(client, "not-a-token").status_code == 401
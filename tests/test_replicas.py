@@ -0,0 +1,80 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, update
+from app.db.database import ReplicaSet, create_database, create_sync_engine
+from app.db.database import replica_set
+from app.db.migrate import migrate
+from app.db.repositories import UserRepository, users_table
+from app.main import app
+from tests.conftest import test_dir
+from tests.test_users import login, register
+
+# Only in the replica, so finding it tells which database served the read
+replica_only_id = 424242
+replica_only_email = "replica-only@example.com"
+
+
+@pytest.fixture(scope="module")
+def replica_url():
+    url = "sqlite:///" + os.path.join(test_dir, "replica.sqlite")
+    engine = create_sync_engine(url)
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(users_table).values(
+                id=replica_only_id,
+                name="replica",
+                last_name="only",
+                email=replica_only_email,
+                password_hash="x",
+                email_confirm=False,
+                creation_date=datetime.now(timezone.utc),
+            )
+        )
+    engine.dispose()
+    return url
+
+
+def test_read_routes_use_the_replica(replica_url, monkeypatch):
+    monkeypatch.setattr(replica_set, "replicas", [create_database(replica_url)])
+    with TestClient(app) as client:
+        register(client, "replica-admin@example.com")
+        headers = login(client, "replica-admin@example.com")
+
+        response = client.get(f"/api/v1/users/{replica_only_id}", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["email"] == replica_only_email
+        # Writes still go to the primary, which does not have the user
+        response = client.put(
+            f"/api/v1/users/update/{replica_only_id}",
+            headers=headers,
+            json={"name": "Renamed"},
+        )
+        assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_reads_after_a_write_use_the_primary(database, replica_url):
+    replica = create_database(replica_url)
+    replicas = ReplicaSet(database, [replica])
+    await replica.connect()
+
+    # Each task runs in its own context, like each request
+    async def handle(write: bool) -> bool:
+        if write:
+            await database.execute(
+                update(users_table).where(users_table.c.id == -1).values(name="x")
+            )
+        repository = UserRepository(replicas.for_read())
+        return await repository.get_by_email(replica_only_email) is not None
+
+    try:
+        assert await asyncio.create_task(handle(write=False))
+        assert not await asyncio.create_task(handle(write=True))
+        # The write does not send later requests to the primary
+        assert await asyncio.create_task(handle(write=False))
+    finally:
+        await replica.disconnect()
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import pytest
+from databases import DatabaseURL
+from app.db.sqlite import PooledSQLitePool
+from tests.conftest import test_dir
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def pool():
+    url = DatabaseURL("sqlite:///" + os.path.join(test_dir, "pool.sqlite"))
+    pool = PooledSQLitePool(url, size=1, max_overflow=0, timeout=0.2)
+    try:
+        yield pool
+    finally:
+        await pool.close()
+
+
+async def test_waiting_for_a_connection_times_out(pool):
+    connection = await pool.acquire()
+    with pytest.raises(TimeoutError):
+        await pool.acquire()
+    await pool.release(connection)
+    # The timed out wait did not keep the slot
+    await pool.release(await pool.acquire())
+
+
+async def test_cancelled_wait_releases_its_slot(pool):
+    connection = await pool.acquire()
+    waiting = asyncio.ensure_future(pool.acquire())
+    await asyncio.sleep(0)
+    # Granted and cancelled in the same loop iteration
+    await pool.release(connection)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    await pool.release(await asyncio.wait_for(pool.acquire(), 1))
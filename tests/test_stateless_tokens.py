@@ -0,0 +1,54 @@
+import jwt
+import pytest
+from app.settings import settings
+from tests.test_users import find_id, login, register
+
+
+@pytest.fixture
+def stateless(monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN_STATELESS", True)
+
+
+def me(client, headers):
+    return client.get("/api/v1/users/me", headers=headers)
+
+
+def claims(headers: dict) -> dict:
+    token = headers["Authorization"].split()[1]
+    return jwt.decode(token, options={"verify_signature": False})
+
+
+def test_password_change_revokes_stateless_tokens(stateless, client):
+    register(client, "stateless-password@example.com")
+    headers = login(client, "stateless-password@example.com")
+    assert "id" in claims(headers)
+    user_id = me(client, headers).json()["id"]
+
+    response = client.put(
+        f"/api/v1/users/update/{user_id}",
+        headers=headers,
+        json={"password": "N3wPassw0rd!"},
+    )
+    assert response.status_code == 200
+    assert me(client, headers).status_code == 401
+    # Tokens issued afterwards carry the new version
+    response = client.post(
+        "/api/v1/users/token",
+        data={"username": "stateless-password@example.com", "password": "N3wPassw0rd!"},
+    )
+    assert response.status_code == 200
+    fresh = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert me(client, fresh).status_code == 200
+
+
+def test_delete_revokes_stateless_tokens(stateless, client):
+    register(client, "stateless-admin@example.com")
+    register(client, "stateless-delete@example.com")
+    admin = login(client, "stateless-admin@example.com")
+    headers = login(client, "stateless-delete@example.com")
+    assert me(client, headers).status_code == 200
+    user_id = find_id(client, admin, "stateless-delete@example.com")
+
+    response = client.delete(f"/api/v1/users/delete/{user_id}", headers=admin)
+    assert response.status_code == 204
+    assert me(client, headers).status_code == 401
@@ -0,0 +1,29 @@
+import csv
+import io
+import pytest
+from app.db.repositories import to_bool
+from app.schema.user_schema import UserFromDB
+from app.utils.user_export import iter_csv
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_csv_export_reads_back():
+    async def rows():
+        for user_id, confirmed in ((1, "1"), (2, "0")):
+            yield {
+                "id": user_id,
+                "name": "ana, maria",
+                "last_name": "lopez",
+                "email": f"user{user_id}@example.com",
+                "email_confirm": confirmed,
+            }
+
+    data = b"".join([chunk async for chunk in iter_csv(rows())])
+    records = list(csv.DictReader(io.StringIO(data.decode())))
+    assert [record["email_confirm"] for record in records] == ["true", "false"]
+    assert [to_bool(record["email_confirm"]) for record in records] == [True, False]
+    user = UserFromDB(**records[0])
+    assert user.id == 1
+    assert user.name == "ana, maria"
+    assert user.email_confirm is True
@@ -0,0 +1,60 @@
+import json
+from typing import List
+import pytest
+from fastapi import HTTPException
+from app.utils.user_import import iter_lines
+from tests.test_users import login, password, register
+
+
+async def collect(chunks: List[bytes], max_line_bytes: int) -> List[str]:
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    return [line async for line in iter_lines(body(), max_line_bytes)]
+
+
+@pytest.mark.anyio
+async def test_lines_split_inside_a_character_are_decoded():
+    data = "José\r\nZoë\n".encode()
+    chunks = [data[:4], data[4:9], data[9:]]
+    assert await collect(chunks, 16) == ["José", "Zoë"]
+
+
+@pytest.mark.anyio
+async def test_line_limit_is_in_bytes():
+    # Five characters, ten bytes
+    line = "ééééé".encode()
+    assert await collect([line + b"\n"], 10) == ["ééééé"]
+    for chunks in ([line + b"\n"], [line[:6], line[6:]]):
+        with pytest.raises(HTTPException) as error:
+            await collect(chunks, 9)
+        assert error.value.status_code == 413
+
+
+@pytest.mark.anyio
+async def test_lines_that_are_not_utf8_are_none():
+    assert await collect(["Zoë\n".encode("latin-1"), b"ok"], 16) == [None, "ok"]
+
+
+def test_import_reports_rows_that_are_not_utf8(client):
+    register(client, "import-admin@example.com")
+    headers = login(client, "import-admin@example.com")
+    rows = [
+        {"name": "Ana", "last_name": "Import", "email": "import1@example.com"},
+        {"name": "Zoë", "last_name": "Import", "email": "import2@example.com"},
+        {"name": "Eva", "last_name": "Import", "email": "import3@example.com"},
+    ]
+    body = b"".join(
+        json.dumps({**row, "password": password}, ensure_ascii=False).encode(
+            "latin-1" if number == 2 else "utf-8"
+        )
+        + b"\n"
+        for number, row in enumerate(rows, start=1)
+    )
+
+    response = client.post("/api/v1/users/import", headers=headers, content=body)
+    assert response.status_code == 200
+    report = [json.loads(line) for line in response.text.splitlines()]
+    assert [result["status"] for result in report] == ["created", "invalid", "created"]
+    assert report[1] == {"row": 2, "status": "invalid", "errors": ["Invalid UTF-8"]}
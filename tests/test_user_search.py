@@ -0,0 +1,65 @@
+import pytest
+from tests.test_users import login, password
+
+people = [
+    ("Marisol", "Quintana", "searchq1@example.com"),
+    ("Marisa", "Quintero", "searchq2@example.com"),
+    ("Quinn", "Marlow", "searchq3@example.com"),
+]
+
+
+@pytest.fixture
+def headers(client):
+    for name, last_name, email in people:
+        response = client.post(
+            "/api/v1/users/register",
+            json={
+                "name": name,
+                "last_name": last_name,
+                "email": email,
+                "password": password,
+            },
+        )
+        assert response.status_code in (201, 422), response.text
+    return login(client, people[0][2])
+
+
+def search(client, headers, q: str, **params) -> list:
+    response = client.get(
+        "/api/v1/users/search", params={"q": q, **params}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return [user["email"] for user in response.json()]
+
+
+def test_words_match_by_prefix(client, headers):
+    assert sorted(search(client, headers, "quint")) == [
+        "searchq1@example.com",
+        "searchq2@example.com",
+    ]
+    assert search(client, headers, "MARL") == ["searchq3@example.com"]
+
+
+def test_every_word_must_match(client, headers):
+    assert search(client, headers, "mari quintana") == ["searchq1@example.com"]
+    assert search(client, headers, "quinn quintana") == []
+
+
+def test_query_syntax_is_stripped(client, headers):
+    assert search(client, headers, '"Quintana":*') == ["searchq1@example.com"]
+    assert search(client, headers, "(quintana^ -mari*") == ["searchq1@example.com"]
+    assert search(client, headers, '(*"') == []
+
+
+def test_pagination(client, headers):
+    everyone = search(client, headers, "searchq")
+    assert sorted(everyone) == [email for _, _, email in people]
+    # Pages are stable and cover every match exactly once
+    assert search(client, headers, "searchq", limit=2) == everyone[:2]
+    assert search(client, headers, "searchq", skip=2, limit=2) == everyone[2:]
+    assert search(client, headers, "searchq", skip=3) == []
+    assert search(client, headers, "searchq", limit=0) == []
+    response = client.get(
+        "/api/v1/users/search", params={"q": "searchq", "skip": -1}, headers=headers
+    )
+    assert response.status_code == 422
@@ -0,0 +1,198 @@
+import asyncio
+import base64
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+password = "Passw0rd!"
+
+
+def register(client: TestClient, email: str) -> dict:
+    response = client.post(
+        "/api/v1/users/register",
+        json={
+            "name": "Test",
+            "last_name": "User",
+            "email": email,
+            "password": password,
+        },
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def login(client: TestClient, email: str) -> dict:
+    response = client.post(
+        "/api/v1/users/token", data={"username": email, "password": password}
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_update_to_taken_email_is_rejected(client):
+    register(client, "taken@example.com")
+    register(client, "update@example.com")
+    headers = login(client, "update@example.com")
+    user_id = client.get("/api/v1/users/me", headers=headers).json()["id"]
+
+    response = client.put(
+        f"/api/v1/users/update/{user_id}",
+        headers=headers,
+        json={"email": "taken@example.com"},
+    )
+    assert response.status_code == 422
+    assert response.json() == {"detail": "This email already exists!"}
+    # Nothing changed
+    user = client.get(f"/api/v1/users/{user_id}", headers=headers).json()
+    assert user["email"] == "update@example.com"
+
+
+def find_id(client: TestClient, headers: dict, email: str) -> int:
+    response = client.get("/api/v1/users/search", params={"q": email}, headers=headers)
+    return next(user["id"] for user in response.json() if user["email"] == email)
+
+
+def test_batch_update_to_taken_email_rolls_back(client):
+    emails = ["batch1@example.com", "batch2@example.com", "batch3@example.com"]
+    for email in emails:
+        register(client, email)
+    headers = login(client, emails[0])
+    first, second, third = (find_id(client, headers, email) for email in emails)
+
+    response = client.post(
+        "/api/v1/users/batch",
+        headers=headers,
+        json={
+            "operations": [
+                {"op": "update", "id": first, "data": {"name": "Renamed"}},
+                {"op": "update", "id": second, "data": {"email": emails[2]}},
+                {"op": "delete", "id": third},
+            ]
+        },
+    )
+    assert response.status_code == 422
+    assert response.json() == {
+        "detail": [{"id": second, "msg": "This email already exists!"}]
+    }
+    # The whole batch was rolled back
+    response = client.get(
+        "/api/v1/users/batch",
+        params={"ids": f"{first},{second},{third}"},
+        headers=headers,
+    )
+    users = [entry["user"] for entry in response.json()]
+    assert [user["name"] for user in users] == ["test"] * 3
+    assert [user["email"] for user in users] == emails
+
+
+def test_etag_changes_when_a_deleted_users_id_is_reused(client):
+    register(client, "etag-admin@example.com")
+    register(client, "etag-old@example.com")
+    headers = login(client, "etag-admin@example.com")
+    user_id = find_id(client, headers, "etag-old@example.com")
+    response = client.get(f"/api/v1/users/{user_id}", headers=headers)
+    etag = response.headers["ETag"]
+    page = client.get("/api/v1/users", params={"limit": 100}, headers=headers)
+    page_etag = page.headers["ETag"]
+
+    response = client.delete(f"/api/v1/users/delete/{user_id}", headers=headers)
+    assert response.status_code == 204
+    register(client, "etag-new@example.com")
+    # SQLite hands the id of the deleted last row to the next one
+    assert find_id(client, headers, "etag-new@example.com") == user_id
+
+    response = client.get(
+        f"/api/v1/users/{user_id}", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["email"] == "etag-new@example.com"
+    page = client.get(
+        "/api/v1/users",
+        params={"limit": 100},
+        headers={**headers, "If-None-Match": page_etag},
+    )
+    assert page.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_concurrent_updates_all_succeed(database):
+    # Each update rewrites the FTS index through the users triggers
+    emails = [f"concurrent{number}@example.com" for number in range(8)]
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        for email in emails:
+            response = await client.post(
+                "/api/v1/users/register",
+                json={
+                    "name": "Test",
+                    "last_name": "User",
+                    "email": email,
+                    "password": password,
+                },
+            )
+            assert response.status_code == 201, response.text
+        response = await client.post(
+            "/api/v1/users/token", data={"username": emails[0], "password": password}
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await client.get(
+            "/api/v1/users/search", params={"q": "concurrent"}, headers=headers
+        )
+        ids = [user["id"] for user in response.json()]
+        assert len(ids) == len(emails)
+
+        responses = await asyncio.gather(
+            *(
+                client.put(
+                    f"/api/v1/users/update/{user_id}",
+                    headers=headers,
+                    json={"name": f"Renamed{attempt}", "last_name": f"User{attempt}"},
+                )
+                for attempt in range(4)
+                for user_id in ids
+            )
+        )
+    assert [response.status_code for response in responses] == [200] * len(responses)
+
+
+def test_tampered_cursor_is_rejected(client):
+    register(client, "cursor1@example.com")
+    register(client, "cursor2@example.com")
+    headers = login(client, "cursor1@example.com")
+    response = client.get(
+        "/api/v1/users", params={"sort": "email", "limit": 1}, headers=headers
+    )
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        "/api/v1/users",
+        params={"sort": "email", "limit": 1, "cursor": cursor},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    def encode(*fields) -> str:
+        raw = json.dumps(fields).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    for sort, cursor in [
+        ("email", encode("email", {"$gt": ""}, 1)),
+        ("email", encode("email", ["a"], 1)),
+        ("email", encode("email", 1, 1)),
+        ("email", encode("email", "a", True)),
+        ("email", encode("name", "a", 1)),
+        ("id", encode("id", "1", 1)),
+        ("id", encode("id", True, 1)),
+        ("creation_date", encode("creation_date", 1, 1)),
+        ("creation_date", encode("creation_date", "yesterday", 1)),
+        ("email", "not a cursor"),
+    ]:
+        response = client.get(
+            "/api/v1/users",
+            params={"sort": sort, "cursor": cursor},
+            headers=headers,
+        )
+        assert response.status_code == 400, cursor
+        assert response.json() == {"detail": "Invalid cursor"}
@@ -0,0 +1,31 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.watchdog import LoopWatchdog
+
+
+def test_report_is_not_served_by_default():
+    with TestClient(app) as client:
+        assert client.get("/debug/event-loop").status_code == 404
+
+
+@pytest.mark.anyio
+async def test_blocking_call_is_recorded():
+    watchdog = LoopWatchdog()
+    watchdog.start(threshold=0.05, interval=0.01)
+    try:
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+    finally:
+        watchdog.stop()
+    report = watchdog.report()
+    assert report["stalls"] == 1
+    assert report["unsampled"] == 0
+    [site] = report["sites"]
+    assert site["count"] == 1
+    assert site["routes"] == {"background": 1}
+    assert "test_blocking_call_is_recorded" in site["blocking_frame"]
+    assert site["max_ms"] >= 150